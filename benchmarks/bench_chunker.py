@@ -0,0 +1,238 @@
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.chunking import MathAwareChunker, is_math_block
+
+GOLDEN_PATH = Path(__file__).resolve().parent / "golden" / "chunker_corpus.json"
+
+
+# The chunker as it was before services/chunking.py, kept here as the reference output
+def legacy_chunk(splitter, text):
+    math_blocks = []
+    pattern = r'\$\$[\s\S]*?\$\$|\$[^\$]+?\$'
+
+    def replace_math(match):
+        idx = len(math_blocks)
+        math_blocks.append(match.group(0))
+        return f"__MATH_BLOCK_{idx}__"
+
+    protected_text = re.sub(pattern, replace_math, text)
+
+    chunks = splitter.split_text(protected_text)
+
+    restored_chunks = []
+    for chunk in chunks:
+        for idx, math_block in enumerate(math_blocks):
+            chunk = chunk.replace(f"__MATH_BLOCK_{idx}__", math_block)
+        restored_chunks.append(chunk)
+
+    return restored_chunks
+
+
+def legacy_is_math_block(text):
+    latex_patterns = [r'\$\$.*?\$\$', r'\$.*?\$', r'\\[a-zA-Z]+', r'\\frac', r'\\int', r'\\sum']
+    for pattern in latex_patterns:
+        if re.search(pattern, text):
+            return True
+
+    math_chars = ['∑', '∫', '∂', '∇', '√', '≠', '≤', '≥', '∈', '⊂', '∞']
+    return any(char in text for char in math_chars)
+
+
+def legacy_stream(splitter, pages):
+    chunks = []
+    buffer = ""
+    for page_text in pages:
+        buffer = f"{buffer}\n\n{page_text}" if buffer else page_text
+        page_chunks = legacy_chunk(splitter, buffer)
+        chunks.extend(page_chunks[:-1])
+        buffer = page_chunks[-1] if page_chunks else ""
+    if buffer.strip():
+        chunks.extend(legacy_chunk(splitter, buffer))
+    return chunks
+
+
+WORDS = (
+    "the function is continuous on the interval so the integral converges and "
+    "производная функции равна нулю в точке экстремума следовательно"
+).split()
+INLINE = [r"$x_{i}$", r"$\alpha + \beta$", r"$f(x) = x^2$", r"$n \to \infty$", r"$\sum_{k=1}^{n} k$", "$a_1$"]
+DISPLAY = [
+    "$$\\int_0^1 f(x)\\,dx = F(1) - F(0)$$",
+    "$$\n\\frac{\\partial u}{\\partial t} = \\Delta u\n$$",
+    "$$\\lim_{n \\to \\infty} \\left(1 + \\frac{1}{n}\\right)^n = e$$",
+]
+ODDITIES = ["∇f ≠ 0", "__MATH_BLOCK_01__", "__MATH_BLOCK_999999__", "cost is $5", "x ≤ y ∈ ℝ"]
+# Formulas that look like a later placeholder: the old chunker spliced the
+# later formula into them, MathAwareChunker restores them verbatim (see
+# services/chunking.py), so they only appear in the golden corpus
+DIVERGENT = ["$__MATH_BLOCK_1__$ and $y$", "$$__MATH_BLOCK_2__$$ then $a$, $b$ and $c$"]
+
+
+def make_corpus(size, seed):
+    rng = random.Random(seed)
+    paragraphs = []
+    length = 0
+    while length < size:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(5, 20))]
+            for _ in range(rng.randint(0, 4)):
+                words.insert(rng.randrange(len(words) + 1), rng.choice(INLINE))
+            if rng.random() < 0.05:
+                words.insert(rng.randrange(len(words) + 1), rng.choice(ODDITIES))
+            sentences.append(" ".join(words).capitalize() + rng.choice([".", ";", ",", "?"]))
+        if rng.random() < 0.3:
+            sentences.append(rng.choice(DISPLAY))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def split_pages(text, page_size):
+    return [text[i:i + page_size] for i in range(0, len(text), page_size)]
+
+
+# Deterministic stand-in for SentenceSplitter in the golden corpus, so the
+# expected chunks can be checked and regenerated without llama-index or
+# tokenizer downloads. Windows of whitespace-separated words with overlap;
+# never cuts inside a placeholder, which is all the chunker relies on.
+class WordWindowSplitter:
+    def __init__(self, chunk_words=40, overlap_words=5):
+        self.chunk_words = chunk_words
+        self.overlap_words = overlap_words
+
+    def split_text(self, text):
+        tokens = re.findall(r'\S+\s*', text)
+        step = self.chunk_words - self.overlap_words
+        return ["".join(tokens[i:i + self.chunk_words]).strip() for i in range(0, max(len(tokens) - self.overlap_words, 1), step)]
+
+
+def golden_cases():
+    cases = [{"name": f"corpus-{seed}", "text": make_corpus(random.Random(seed).randint(300, 1500), seed)} for seed in range(12)]
+    cases += [{"name": f"oddity-{i}", "text": f"Before {oddity} and $x$ after, $$y$$ too."} for i, oddity in enumerate(ODDITIES)]
+    cases += [{"name": f"divergent-{i}", "text": text, "divergent": True} for i, text in enumerate(DIVERGENT)]
+    return cases
+
+
+def write_golden(page_size):
+    splitter = WordWindowSplitter()
+    chunker = MathAwareChunker(splitter)
+    cases = []
+    for case in golden_cases():
+        pages = split_pages(case["text"], page_size)
+        stream = chunker.stream()
+        streamed = [chunk for page in pages for chunk in stream.feed(page)] + stream.finish()
+        chunks = chunker.split(case["text"])
+        if case.get("divergent"):
+            case["legacy_chunks"] = legacy_chunk(splitter, case["text"])
+        elif chunks != legacy_chunk(splitter, case["text"]) or streamed != legacy_stream(splitter, pages):
+            raise SystemExit(f"{case['name']}: new chunker differs from the old one, not writing golden output")
+        cases.append({**case, "chunks": chunks, "streamed": streamed})
+
+    GOLDEN_PATH.parent.mkdir(exist_ok=True)
+    golden = {"splitter": vars(splitter), "page_size": page_size, "cases": cases}
+    GOLDEN_PATH.write_text(json.dumps(golden, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+    print(f"wrote {len(cases)} cases to {GOLDEN_PATH}")
+
+
+def check_golden():
+    golden = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    chunker = MathAwareChunker(WordWindowSplitter(**golden["splitter"]))
+    mismatches = 0
+    for case in golden["cases"]:
+        stream = chunker.stream()
+        streamed = [chunk for page in split_pages(case["text"], golden["page_size"]) for chunk in stream.feed(page)]
+        streamed += stream.finish()
+        if chunker.split(case["text"]) != case["chunks"]:
+            mismatches += 1
+            print(f"{case['name']}: split output differs from {GOLDEN_PATH.name}")
+        if streamed != case["streamed"]:
+            mismatches += 1
+            print(f"{case['name']}: streamed output differs from {GOLDEN_PATH.name}")
+    print(f"committed golden corpus: {len(golden['cases'])} cases, {mismatches} mismatches")
+    return mismatches
+
+
+def best_of(repeat, fn, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Math-aware chunker: golden-output check and timings against the old chunker")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2_000, 50_000, 500_000], help="Corpus sizes in characters")
+    parser.add_argument("--golden-docs", type=int, default=50, help="Random documents checked for identical output")
+    parser.add_argument("--page-size", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check-golden", action="store_true", help=f"Only check against {GOLDEN_PATH.name}, no llama-index needed")
+    parser.add_argument("--write-golden", action="store_true", help=f"Regenerate {GOLDEN_PATH.name} (refuses if the old chunker disagrees)")
+    args = parser.parse_args()
+
+    if args.write_golden:
+        write_golden(page_size=300)
+        return
+    mismatches = check_golden()
+    if args.check_golden:
+        sys.exit(1 if mismatches else 0)
+
+    from llama_index.core.node_parser import SentenceSplitter
+
+    # Same settings as ChromaDBClient's defaults
+    splitter = SentenceSplitter(
+        chunk_size=512,
+        chunk_overlap=50,
+        paragraph_separator="\n\n",
+        secondary_chunking_regex="[^,.;。？！]+[,.;。？！]?"
+    )
+    chunker = MathAwareChunker(splitter)
+
+    for seed in range(args.golden_docs):
+        text = make_corpus(random.Random(seed).randint(200, 20_000), seed)
+        chunks = chunker.split(text)
+        if chunks != legacy_chunk(splitter, text):
+            mismatches += 1
+            print(f"seed {seed}: split output differs")
+        if [is_math_block(chunk) for chunk in chunks] != [legacy_is_math_block(chunk) for chunk in chunks]:
+            mismatches += 1
+            print(f"seed {seed}: is_math_block differs")
+
+        stream = chunker.stream()
+        streamed = [chunk for page in split_pages(text, args.page_size) for chunk in stream.feed(page)]
+        streamed += stream.finish()
+        if streamed != legacy_stream(splitter, split_pages(text, args.page_size)):
+            mismatches += 1
+            print(f"seed {seed}: streamed output differs")
+    print(f"random corpus: {args.golden_docs} documents, {mismatches} mismatches in total")
+
+    for size in args.sizes:
+        text = make_corpus(size, size)
+        formulas = text.count("$")
+        legacy_time, legacy_chunks = best_of(args.repeat, legacy_chunk, splitter, text)
+        new_time, new_chunks = best_of(args.repeat, chunker.split, text)
+        assert new_chunks == legacy_chunks
+        legacy_math, _ = best_of(args.repeat, lambda: [legacy_is_math_block(chunk) for chunk in new_chunks])
+        new_math, _ = best_of(args.repeat, lambda: [is_math_block(chunk) for chunk in new_chunks])
+        print(
+            f"{size:>9} chars, {len(new_chunks):>5} chunks, ~{formulas // 2:>6} formulas: "
+            f"split {legacy_time * 1000:.1f}ms -> {new_time * 1000:.1f}ms, "
+            f"is_math_block {legacy_math * 1000:.2f}ms -> {new_math * 1000:.2f}ms"
+        )
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
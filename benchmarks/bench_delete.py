@@ -0,0 +1,72 @@
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_openai import fake_openai_env
+
+
+def fill(client, TextNode, start, stop, doc_size, dimensions, rng):
+    for batch_start in range(start, stop, 1000):
+        client.index.insert_nodes([
+            TextNode(
+                text=f"Synthetic chunk {i}",
+                id_=f"doc{i // doc_size}_chunk_{i % doc_size + 1}",
+                metadata={"doc_id_prefix": f"doc{i // doc_size}", "chunk_index": i % doc_size + 1},
+                embedding=[rng.uniform(-1, 1) for _ in range(dimensions)]
+            )
+            for i in range(batch_start, min(batch_start + 1000, stop))
+        ])
+
+
+def legacy_delete(client, prefix):
+    # What delete_by_prefix set out to do: read the whole collection, then delete matches one id at a time
+    ids = client.chroma_collection.get(include=[])["ids"]
+    deleted = 0
+    for chunk_id in ids:
+        if chunk_id.startswith(prefix + "_chunk_"):
+            client.chroma_collection.delete(ids=[chunk_id])
+            deleted += 1
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whole-document delete cost as the collection grows")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--doc-size", type=int, default=500, help="Chunks per document")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    with fake_openai_env(latency=0) as (server, data_dir):
+        from llama_index.core.schema import TextNode
+        from services.chroma import ChromaDBClient
+
+        client = ChromaDBClient(path=data_dir, collection_name="bench")
+        rng = random.Random(0)
+
+        filled = 0
+        for size in sorted(args.sizes):
+            fill(client, TextNode, filled, size, args.doc_size, server.dimensions, rng)
+            filled = size
+            docs = size // args.doc_size
+
+            start = time.perf_counter()
+            deleted = client.delete_document(f"doc{docs - 1}")
+            elapsed = time.perf_counter() - start
+            line = f"{size:>7} chunks: delete_document {deleted} chunks in {elapsed * 1000:.0f}ms"
+
+            if not args.skip_legacy:
+                start = time.perf_counter()
+                deleted = legacy_delete(client, f"doc{docs - 2}")
+                line += f", scan + per-id delete {deleted} chunks in {(time.perf_counter() - start) * 1000:.0f}ms"
+            print(line)
+
+            # Put the deleted documents back so every size starts from a full collection
+            fill(client, TextNode, (docs - 2) * args.doc_size, size, args.doc_size, server.dimensions, rng)
+
+
+if __name__ == "__main__":
+    main()
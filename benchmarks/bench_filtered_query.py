@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_openai import fake_openai_env
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(name, latencies, matched, wanted):
+    print(
+        f"{name:>12}: p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms, "
+        f"mean {statistics.mean(latencies) * 1000:.1f}ms, "
+        f"{matched}/{wanted} requested results returned"
+    )
+
+
+async def run(client, build_where, sources, args):
+    rng = random.Random(1)
+    targets = [rng.choice(sources) for _ in range(args.requests)]
+
+    # What callers did before: over-fetch and drop non-matching chunks client-side
+    latencies, matched = [], 0
+    for i, source in enumerate(targets):
+        start = time.perf_counter()
+        results = await client.query_async(f"overfetch {i}", n_results=args.n_results * args.overfetch)
+        hits = [meta for meta in results["metadatas"][0] if meta.get("source") == source and meta.get("has_math")]
+        latencies.append(time.perf_counter() - start)
+        matched += len(hits[:args.n_results])
+    report("client-side", latencies, matched, args.requests * args.n_results)
+
+    latencies, matched = [], 0
+    for i, source in enumerate(targets):
+        start = time.perf_counter()
+        results = await client.query_async(
+            f"pushdown {i}", n_results=args.n_results, filters=build_where(source=source, has_math=True)
+        )
+        latencies.append(time.perf_counter() - start)
+        matched += len(results["ids"][0])
+    report("pushdown", latencies, matched, args.requests * args.n_results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/query latency and recall: Chroma where pushdown vs client-side filtering")
+    parser.add_argument("--documents", type=int, default=50000)
+    parser.add_argument("--sources", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--overfetch", type=int, default=10)
+    args = parser.parse_args()
+
+    # Every query is distinct anyway; keep the result cache out of the numbers
+    with fake_openai_env(env={"QUERY_RESULT_CACHE_SIZE": "0"}, latency=0) as (server, data_dir):
+        from llama_index.core.schema import TextNode
+        from services.chroma import ChromaDBClient, build_where
+
+        client = ChromaDBClient(path=data_dir, collection_name="bench")
+
+        sources = [f"source_{i}.pdf" for i in range(args.sources)]
+        rng = random.Random(0)
+        for start in range(0, args.documents, 1000):
+            client.index.insert_nodes([
+                TextNode(
+                    text=f"Synthetic chunk {i}",
+                    id_=f"bench_chunk_{i}",
+                    metadata={
+                        "source": sources[i % len(sources)],
+                        "doc_id_prefix": f"bench_{i % len(sources)}",
+                        "chunk_index": i // len(sources),
+                        "has_math": rng.random() < 0.3,
+                    },
+                    embedding=[rng.uniform(-1, 1) for _ in range(server.dimensions)]
+                )
+                for i in range(start, min(start + 1000, args.documents))
+            ])
+
+        asyncio.run(run(client, build_where, sources, args))
+
+
+if __name__ == "__main__":
+    main()
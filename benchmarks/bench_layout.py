@@ -0,0 +1,54 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import YOLO_IMGSZ
+from services.parser import detect_layout_batch, iter_page_windows
+
+
+def load_pages(path, pages, dpi):
+    cv_images = []
+    for _, pil_images in iter_page_windows(path, dpi=dpi, window=pages):
+        for pil_img in pil_images:
+            cv_images.append(cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR))
+        break
+    return cv_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-page vs batched YOLO layout detection")
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--imgsz", type=int, default=YOLO_IMGSZ)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_pages(args.pdf, args.pages, args.dpi)
+    print(f"Loaded {len(images)} pages at {args.dpi} dpi")
+
+    # Warm up the model so the first measured run does not pay for lazy init
+    detect_layout_batch(images[:1], batch_size=1, imgsz=args.imgsz)
+
+    # Same imgsz and verbosity on both sides, so only the batching differs
+    for name, run in (
+        ("per-page", lambda: [detect_layout_batch([image], batch_size=1, imgsz=args.imgsz) for image in images]),
+        ("batched", lambda: detect_layout_batch(images, batch_size=args.batch_size, imgsz=args.imgsz)),
+    ):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:>9}: {len(images) / best:.2f} pages/sec ({best:.2f}s best of {args.repeat})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_openai import fake_openai_env
+
+
+async def run(client, chunks):
+    start = time.perf_counter()
+    summaries = await asyncio.gather(*[client._generate_summary_async(chunk) for chunk in chunks])
+    elapsed = time.perf_counter() - start
+    fallbacks = sum(1 for chunk, summary in zip(chunks, summaries) if summary == client._fallback_summary(chunk))
+    return elapsed, fallbacks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive limiter against a throttling fake LLM server")
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--server-concurrency", type=int, default=6)
+    parser.add_argument("--initial-concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    with fake_openai_env(latency=args.latency, max_concurrent=args.server_concurrency) as (server, data_dir):
+        from services.chroma import ChromaDBClient
+
+        client = ChromaDBClient(
+            path=data_dir, collection_name="bench", max_concurrent_requests=args.initial_concurrency
+        )
+        chunks = [f"Section {i}: eigenvalues of a symmetric matrix are real. " * 4 for i in range(args.chunks)]
+        elapsed, fallbacks = asyncio.run(run(client, chunks))
+
+        print(f"{len(chunks)} summaries in {elapsed:.2f}s, {fallbacks} fell back to the first 30 words")
+        print(f"server: {server.calls} requests, {server.throttled} throttled")
+        print(f"limiter: {client.get_limiter_stats()['llm']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_pix2tex import FakePix2TexServer
+from services.cache import DiskCache
+from services.pix2tex import FormulaOcrClient
+
+
+def make_crops(count, seed):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(32, 96, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def check(failures, ok, message):
+    print(f"{'ok' if ok else 'FAIL':>4}: {message}")
+    if not ok:
+        failures.append(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FormulaOcrClient against a stub pix2tex: retries, request sharing, cache hits, throughput")
+    parser.add_argument("--crops", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per stub request")
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=2)
+    args = parser.parse_args()
+
+    failures = []
+    with FakePix2TexServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as data_dir:
+        cache_path = os.path.join(data_dir, "pix2tex_cache.sqlite3")
+
+        def new_client(max_in_flight=args.max_in_flight, cache=True):
+            return FormulaOcrClient(
+                url=server.url,
+                max_in_flight=max_in_flight,
+                retries=args.retries,
+                cache=DiskCache(cache_path, 16 * 1024 * 1024) if cache else None,
+            )
+
+        # Transient 5xx responses within the retry budget are invisible to callers
+        server.reset(fail_first=args.retries)
+        client = new_client(cache=False)
+        latex = client.recognize(make_crops(1, 0)[0])
+        check(failures, latex.startswith("x_") and server.calls == args.retries + 1,
+              f"{args.retries} x 503 then success: {server.calls} requests, got {latex!r}")
+        client.close()
+
+        # One more failure than retries allowed surfaces as an error
+        server.reset(fail_first=args.retries + 1)
+        client = new_client(cache=False)
+        try:
+            client.recognize(make_crops(1, 1)[0])
+            raised = False
+        except Exception:
+            raised = True
+        check(failures, raised and server.calls == args.retries + 1,
+              f"{args.retries + 1} x 503: error raised after {server.calls} requests")
+        client.close()
+
+        # Identical crops submitted together share one request
+        server.reset()
+        client = new_client(cache=False)
+        crop = make_crops(1, 2)[0]
+        results = {future.result() for future in [client.submit(crop) for _ in range(16)]}
+        check(failures, len(results) == 1 and server.calls == 1,
+              f"16 identical crops in flight: {server.calls} request(s)")
+        client.close()
+
+        # Throughput and the in-flight cap, cold cache
+        crops = make_crops(args.crops, 3)
+        timings = {}
+        for max_in_flight in sorted({1, args.max_in_flight}):
+            server.reset()
+            client = new_client(max_in_flight=max_in_flight, cache=False)
+            start = time.perf_counter()
+            for future in [client.submit(crop) for crop in crops]:
+                future.result()
+            timings[max_in_flight] = time.perf_counter() - start
+            client.close()
+            check(failures, server.peak_in_flight <= max_in_flight,
+                  f"max_in_flight={max_in_flight}: peak {server.peak_in_flight} concurrent requests")
+            print(f"      {args.crops} crops in {timings[max_in_flight]:.2f}s ({args.crops / timings[max_in_flight]:.1f} crops/sec)")
+
+        # A second client on the same cache file answers without the server
+        client = new_client()
+        first = [future.result() for future in [client.submit(crop) for crop in crops]]
+        client.close()
+        server.reset()
+        client = new_client()
+        start = time.perf_counter()
+        second = [future.result() for future in [client.submit(crop) for crop in crops]]
+        elapsed = time.perf_counter() - start
+        client.close()
+        check(failures, second == first and server.calls == 0,
+              f"warm cache: {args.crops} crops, {server.calls} requests, {elapsed * 1000:.1f}ms")
+
+    print(f"{len(failures)} failed checks")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_openai import fake_openai_env
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def load(name, handler, queries, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            start = time.perf_counter()
+            await handler(query)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(query) for query in queries])
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>9}: p50 {percentile(latencies, 0.5) * 1000:.0f}ms, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.0f}ms, "
+        f"mean {statistics.mean(latencies) * 1000:.0f}ms, {len(queries) / elapsed:.1f} req/s"
+    )
+
+
+async def run(client, queries, concurrency, n_results):
+    # "blocking" is what the endpoints did before: sync retrieve on the event loop
+    async def blocking(query):
+        client.query(query_text=query, n_results=n_results)
+
+    async def non_blocking(query):
+        await client.query_async(query_text=query, n_results=n_results)
+
+    await load("blocking", blocking, queries, concurrency)
+    await load("async", non_blocking, queries, concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p99 /query latency under concurrency, blocking vs async retrieval")
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--n-results", type=int, default=3)
+    args = parser.parse_args()
+
+    # Blocking vs async query handling is what is compared here; the
+    # first run would otherwise fill both caches for the second
+    with fake_openai_env(
+        env={"QUERY_RESULT_CACHE_SIZE": "0", "QUERY_EMBEDDING_CACHE_SIZE": "0"},
+        latency=args.embed_latency,
+    ) as (server, data_dir):
+        from llama_index.core.schema import TextNode
+        from services.chroma import ChromaDBClient
+
+        client = ChromaDBClient(path=data_dir, collection_name="bench")
+
+        rng = random.Random(0)
+        for start in range(0, args.documents, 1000):
+            client.index.insert_nodes([
+                TextNode(
+                    text=f"Synthetic chunk {i}",
+                    id_=f"bench_chunk_{i}",
+                    metadata={"doc_id_prefix": "bench", "chunk_index": i},
+                    embedding=[rng.uniform(-1, 1) for _ in range(server.dimensions)]
+                )
+                for i in range(start, min(start + 1000, args.documents))
+            ])
+
+        queries = [f"question number {i % 50}" for i in range(args.requests)]
+        asyncio.run(run(client, queries, args.concurrency, args.n_results))
+
+
+if __name__ == "__main__":
+    main()
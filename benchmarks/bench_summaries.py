@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_openai import fake_openai_env
+
+
+async def run(client, server, chunks):
+    # One event loop for both runs: the client's limiter binds to the first loop it waits on
+    for name, batched in (("per-chunk", False), ("batched", True)):
+        server.reset()
+        start = time.perf_counter()
+        if batched:
+            await client._generate_summaries_async(chunks)
+        else:
+            await asyncio.gather(*[client._generate_summary_async(chunk) for chunk in chunks])
+        elapsed = time.perf_counter() - start
+        print(f"{name:>9}: {server.calls} LLM calls, {elapsed:.2f}s for {len(chunks)} chunks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-chunk vs batched summarization against a fake LLM server")
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    with fake_openai_env(latency=args.latency) as (server, data_dir):
+        from services.chroma import ChromaDBClient
+
+        client = ChromaDBClient(path=data_dir, collection_name="bench", summary_batch_size=args.batch_size)
+        chunks = [f"Section {i}: the Jacobian collects all first-order partial derivatives. " * 8 for i in range(args.chunks)]
+        asyncio.run(run(client, server, chunks))
+
+
+if __name__ == "__main__":
+    main()
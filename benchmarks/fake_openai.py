@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Minimal stand-in for the OpenAI chat completions and embeddings APIs.
+# Answers batched summary prompts with a JSON object, everything else with
+# plain text, and embeds text as a deterministic pseudo-random vector.
+# With max_concurrent set, requests above that many in flight get a 429.
+class FakeOpenAIServer:
+    def __init__(self, latency: float = 0.2, port: int = 0, max_concurrent: int = None, dimensions: int = 1536):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.max_concurrent = max_concurrent
+        self.calls = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.calls += 1
+                    throttled = server.max_concurrent is not None and server.in_flight >= server.max_concurrent
+                    if throttled:
+                        server.throttled += 1
+                    else:
+                        server.in_flight += 1
+
+                if throttled:
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, {"retry-after": "0.2"})
+                    return
+
+                try:
+                    time.sleep(server.latency)
+                    if self.path.endswith("/embeddings"):
+                        self._embed(body)
+                    else:
+                        self._complete(body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _send(self, status, payload, headers=None):
+                payload = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _embed(self, body):
+                inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                data = []
+                for i, text in enumerate(inputs):
+                    rng = random.Random(hashlib.sha256(str(text).encode("utf-8")).digest())
+                    vector = [rng.uniform(-1, 1) for _ in range(server.dimensions)]
+                    if body.get("encoding_format") == "base64":
+                        vector = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+                    data.append({"object": "embedding", "index": i, "embedding": vector})
+
+                self._send(200, {
+                    "object": "list",
+                    "data": data,
+                    "model": body.get("model", "fake"),
+                    "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+                })
+
+            def _complete(self, body):
+                prompt = body["messages"][-1]["content"]
+                if "Return a JSON object" in prompt:
+                    section_ids = re.findall(r"^\[(\d+)\]$", prompt, re.MULTILINE)
+                    content = json.dumps({section_id: f"Summary of section {section_id}" for section_id in section_ids})
+                else:
+                    content = "Summary of a single section"
+
+                self._send(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 16, "total_tokens": len(prompt) // 4 + 16},
+                })
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.throttled = 0
+
+
+# Starts a FakeOpenAIServer, points the OpenAI clients at it and keeps every
+# cache and store the client opens inside a temp dir, away from the real
+# ones. Extra env settings (e.g. disabled caches) go in env. Has to run
+# before services.chroma is imported, since config reads the env at import.
+@contextmanager
+def fake_openai_env(env=None, **server_kwargs):
+    with FakeOpenAIServer(**server_kwargs) as server, tempfile.TemporaryDirectory() as data_dir:
+        os.environ.setdefault("OPEN_AI_API", "sk-fake")
+        os.environ["OPENAI_BASE_URL"] = server.url
+        os.environ["OPENAI_API_BASE"] = server.url
+        os.environ["SUMMARY_CACHE_PATH"] = os.path.join(data_dir, "summary_cache.sqlite3")
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(data_dir, "embedding_cache.sqlite3")
+        os.environ["STATS_PATH"] = os.path.join(data_dir, "stats.sqlite3")
+        os.environ.update(env or {})
+        yield server, data_dir
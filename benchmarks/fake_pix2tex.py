@@ -0,0 +1,70 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Minimal stand-in for the pix2tex /predict endpoint. Answers every upload
+# with a deterministic LaTeX string derived from the request body. The first
+# fail_first requests get a 503 so client retries can be exercised, and the
+# peak number of requests in flight is recorded.
+class FakePix2TexServer:
+    def __init__(self, latency: float = 0.05, port: int = 0, fail_first: int = 0, fail_status: int = 503):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.calls = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with server._lock:
+                    server.calls += 1
+                    failing = server.failed < server.fail_first
+                    if failing:
+                        server.failed += 1
+                    server.in_flight += 1
+                    server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+
+                try:
+                    time.sleep(server.latency)
+                    if failing:
+                        self._send(server.fail_status, "model not ready")
+                    else:
+                        self._send(200, f"x_{{{hashlib.sha256(body).hexdigest()[:8]}}}")
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _send(self, status, text):
+                payload = text.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/predict"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+
+    def reset(self, fail_first: int = 0):
+        with self._lock:
+            self.fail_first = fail_first
+            self.calls = 0
+            self.failed = 0
+            self.peak_in_flight = 0
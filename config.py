@@ -3,4 +3,72 @@ import os
 
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPEN_AI_API")
\ No newline at end of file
+OPENAI_API_KEY = os.getenv("OPEN_AI_API")
+
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "200"))
+PDF_PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", "4"))
+
+YOLO_MODEL_FILE = os.getenv("YOLO_MODEL_FILE", "yolov8s-doclaynet.pt")
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "4"))
+# 640 is what the per-page detect_layout used implicitly (the YOLO default)
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_BACKEND = os.getenv("OCR_BACKEND", "tesserocr")
+
+# off: always OCR, direct: use the text layer as-is, hybrid: text layer for
+# text blocks, OCR/pix2tex only for formula and unknown regions
+TEXT_LAYER_MODE = os.getenv("TEXT_LAYER_MODE", "hybrid")
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "200"))
+
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "1") == "1"
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", "./data/parse_cache.sqlite3")
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+PIX2TEX_URL = os.getenv("PIX2TEX_URL", "http://localhost:8502/predict")
+PIX2TEX_MAX_IN_FLIGHT = int(os.getenv("PIX2TEX_MAX_IN_FLIGHT", "4"))
+PIX2TEX_TIMEOUT = float(os.getenv("PIX2TEX_TIMEOUT", "30"))
+PIX2TEX_RETRIES = int(os.getenv("PIX2TEX_RETRIES", "2"))
+PIX2TEX_CACHE_PATH = os.getenv("PIX2TEX_CACHE_PATH", "./data/pix2tex_cache.sqlite3")
+PIX2TEX_CACHE_MAX_BYTES = int(os.getenv("PIX2TEX_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "./data/spool")
+INGEST_JOBS_PATH = os.getenv("INGEST_JOBS_PATH", "./data/jobs.sqlite3")
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", "32"))
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "8"))
+SUMMARY_BATCH_TOKEN_BUDGET = int(os.getenv("SUMMARY_BATCH_TOKEN_BUDGET", "3000"))
+
+# Bump to recompute every cached summary after a change the prompt text does not show
+SUMMARY_PROMPT_VERSION = os.getenv("SUMMARY_PROMPT_VERSION", "1")
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "./data/summary_cache.sqlite3")
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "5000"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "2000000"))
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "5000"))
+EMBED_TOKENS_PER_MINUTE = float(os.getenv("EMBED_TOKENS_PER_MINUTE", "5000000"))
+LIMITER_MAX_CONCURRENCY = int(os.getenv("LIMITER_MAX_CONCURRENCY", "64"))
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+QUERY_RESULT_CACHE_SIZE = int(os.getenv("QUERY_RESULT_CACHE_SIZE", "1024"))
+QUERY_RESULT_CACHE_TTL = float(os.getenv("QUERY_RESULT_CACHE_TTL", "300"))
+
+# Set ANSWER_CACHE_SIZE=0 to always call the LLM
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Upper bound on retrieved context sent with each /query-llm prompt (~4 chars per token)
+QA_CONTEXT_TOKEN_BUDGET = int(os.getenv("QA_CONTEXT_TOKEN_BUDGET", "3000"))
+
+BACKFILL_JOBS_PATH = os.getenv("BACKFILL_JOBS_PATH", "./data/backfills.sqlite3")
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "64"))
+
+STATS_PATH = os.getenv("STATS_PATH", "./data/stats.sqlite3")
@@ -1,16 +1,21 @@
-from services.parser import parse_pdf
-from services.chroma import ChromaDBClient
-import os
-import tempfile
+from services.cache import get_parse_cache
+from services.chroma import ChromaDBClient, build_where
+from services.backfill import MetadataBackfillManager
+from services.jobs import IngestionJobManager
 
+import asyncio
+import json
+import logging
 from typing import Optional
 from pathlib import Path
 
-from fastapi import FastAPI, UploadFile, File, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import Depends, FastAPI, UploadFile, File, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 app.add_middleware(
@@ -22,7 +27,26 @@ app.add_middleware(
 )
 
 client = ChromaDBClient(path="./data", collection_name="notes")
+jobs = IngestionJobManager(client)
+backfills = MetadataBackfillManager(client)
+
+
+@app.on_event("startup")
+async def resume_backfills():
+    backfills.resume_unfinished()
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    jobs.shutdown()
 
+def query_filters(
+    source: Optional[str] = Query(None, description="Only chunks from this source file"),
+    doc_id_prefix: Optional[str] = Query(None, description="Only chunks of this document"),
+    has_math: Optional[bool] = Query(None, description="Only chunks with (or without) math"),
+    chunk_index_min: Optional[int] = Query(None, description="Lowest chunk_index to include"),
+    chunk_index_max: Optional[int] = Query(None, description="Highest chunk_index to include")
+) -> Optional[dict]:
+    return build_where(source, doc_id_prefix, has_math, chunk_index_min, chunk_index_max)
 
 @app.get("/")
 def serve_front():
@@ -33,31 +57,34 @@ async def upload_pdf(file: UploadFile = File(...)):
     if file.content_type != "application/pdf":
         return {"error": "Файл не является PDF"}
 
-    pdf_bytes = await file.read()
+    job_id = await jobs.submit(file.filename, file.file)
+    return {"status": "queued", "job_id": job_id}
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(pdf_bytes)
-        tmp_path = tmp.name
+@app.get("/jobs")
+async def list_jobs(limit: int = Query(50, description="Number of most recent jobs")):
+    return {"jobs": jobs.list(limit)}
 
-    try:
-        text = parse_pdf(tmp_path)
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job
 
-        if not text.strip():
-            return {"error": "PDF без текста"}
-
-        metadata = {"source": file.filename}
-        await client.add_document_chunks_async(doc_id_prefix=file.filename, text=text, metadata=metadata)
-
-        return {"status": "ok", "chunks_added": True}
-    finally:
-        os.remove(tmp_path)
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job
 
 @app.get("/query")
 async def query_pdf(
     q: str = Query(..., description="Query text"),
-    n_results: int = Query(3, description="Number of results")
+    n_results: int = Query(3, description="Number of results"),
+    filters: Optional[dict] = Depends(query_filters)
 ):
-    results = client.query(query_text=q, n_results=n_results)
+    results = await client.query_async(query_text=q, n_results=n_results, filters=filters)
 
     response = []
     for doc, meta, dist in zip(
@@ -74,15 +101,49 @@ async def query_pdf(
     return JSONResponse(content={"query": q, "results": response})
 
 @app.get("/documents")
-async def get_all_docs():
-    all_docs = client.get_all()
-    return JSONResponse(content=all_docs)
+async def get_all_docs(
+    offset: Optional[int] = Query(None, ge=0, description="Position to start from (next_offset of the previous page)"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Chunks per page"),
+    include_text: bool = Query(True, description="Include chunk text, otherwise ids and metadata only"),
+    output_format: str = Query(
+        "json", alias="format", pattern="^(json|ndjson)$",
+        description="json for one page (or every chunk without offset/limit), ndjson to stream every chunk from offset on"
+    ),
+    filters: Optional[dict] = Depends(query_filters)
+):
+    if output_format == "ndjson":
+        def lines():
+            for chunk in client.iter_all(page_size=limit or 500, include_text=include_text, where=filters, offset=offset or 0):
+                yield json.dumps(chunk, ensure_ascii=False) + "\n"
+
+        # Sync generator, so Starlette pulls each page from Chroma in a worker thread
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    if offset is None and limit is None:
+        # No paging asked for: the bare array existing consumers expect,
+        # streamed so the whole collection is never held in memory
+        def array():
+            separator = "["
+            for chunk in client.iter_all(include_text=include_text, where=filters):
+                yield separator + json.dumps(chunk, ensure_ascii=False)
+                separator = ","
+            yield "[]" if separator == "[" else "]"
+
+        return StreamingResponse(array(), media_type="application/json")
+
+    page = await asyncio.to_thread(client.get_page, offset or 0, limit or 100, include_text, filters)
+    return JSONResponse(content=page)
 
 @app.delete("/delete-doc")
 async def delete_doc(doc_id: str = Query(..., description="Document ID to delete")):
     client.delete(doc_id)
     return {"status": "ok", "deleted_doc_id": doc_id}
 
+@app.delete("/documents/{doc_id_prefix}")
+async def delete_document(doc_id_prefix: str):
+    deleted = await asyncio.to_thread(client.delete_document, doc_id_prefix)
+    return {"status": "ok", "doc_id_prefix": doc_id_prefix, "chunks_deleted": deleted}
+
 @app.post("/clear-collection")
 async def clear_collection():
     client.clear()
@@ -93,26 +154,123 @@ async def rewrite_metadatas(
     limit: Optional[int] = Query(None, description="Limit number of documents to update"),
     start_index: int = Query(0, description="Start index for updating documents")
 ):
-    updated_count = client.rewrite_chunk_metadatas(limit=limit, start_index=start_index)
-    return {"status": "ok", "documents_updated": updated_count}
+    job_id = backfills.submit(limit, start_index)
+    return {"status": "queued", "backfill_id": job_id}
+
+@app.get("/backfills")
+async def list_backfills(limit: int = Query(50, description="Number of most recent backfills")):
+    return {"backfills": backfills.list(limit)}
+
+@app.get("/backfills/{backfill_id}")
+async def get_backfill(backfill_id: str):
+    job = backfills.get(backfill_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Backfill not found"})
+    return job
+
+@app.post("/backfills/{backfill_id}/resume")
+async def resume_backfill(backfill_id: str):
+    job = backfills.resume(backfill_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Backfill not found"})
+    return job
+
+@app.post("/backfills/{backfill_id}/cancel")
+async def cancel_backfill(backfill_id: str):
+    job = backfills.cancel(backfill_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Backfill not found"})
+    return job
+
+@app.get("/stats")
+async def get_stats():
+    return client.get_stats()
+
+@app.post("/stats/rebuild")
+async def rebuild_stats():
+    return await asyncio.to_thread(client.rebuild_stats)
+
+@app.get("/parse-cache")
+async def parse_cache_stats():
+    return get_parse_cache().stats()
+
+@app.post("/parse-cache/clear")
+async def clear_parse_cache():
+    get_parse_cache().clear()
+    return {"status": "ok", "parse_cache_cleared": True}
+
+@app.get("/embedding-cache")
+async def embedding_cache_stats():
+    return client.get_embedding_cache_stats()
+
+@app.get("/summary-cache")
+async def summary_cache_stats():
+    return client.get_summary_cache_stats()
+
+@app.get("/limiter-stats")
+async def limiter_stats():
+    return client.get_limiter_stats()
+
+@app.get("/context-stats")
+async def context_stats():
+    return client.get_context_stats()
+
+@app.get("/query-cache-stats")
+async def query_cache_stats():
+    return client.get_query_cache_stats()
+
+def _serialize_node(node):
+    return {
+        "id": node.node_id,
+        "text": node.text,
+        "metadata": node.metadata
+    }
+
+@app.get("/query-llm-stream")
+async def query_with_llm_stream(
+    request: Request,
+    q: str = Query(..., description="Query text"),
+    n_results: int = Query(3, description="Number of results"),
+    filters: Optional[dict] = Depends(query_filters)
+):
+    async def events():
+        stream = client.query_with_llm_stream(query_text=q, n_results=n_results, filters=filters)
+        try:
+            async for event in stream:
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, stopping answer stream")
+                    break
+
+                if event["type"] == "sources":
+                    data = {"source_nodes": [_serialize_node(node) for node in event["source_nodes"]]}
+                elif event["type"] == "token":
+                    data = {"content": event["content"]}
+                else:
+                    data = {}
+                yield f"event: {event['type']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"Answer stream failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/query-llm")
 async def query_with_llm(
     q: str = Query(..., description="Query text"),
-    n_results: int = Query(3, description="Number of results")
+    n_results: int = Query(3, description="Number of results"),
+    filters: Optional[dict] = Depends(query_filters)
 ):
-    results = await client.query_with_llm_async(query_text=q, n_results=n_results)
+    results = await client.query_with_llm_async(query_text=q, n_results=n_results, filters=filters)
 
     response = {
         "answer": results["answer"],
-        "source_nodes": [
-            {
-                "id": node.node_id,
-                "text": node.text,
-                "metadata": node.metadata
-            }
-            for node in results["source_nodes"]
-        ],
+        "source_nodes": [_serialize_node(node) for node in results["source_nodes"]],
         "ids": results["ids"],
         "documents": results["documents"]
     }
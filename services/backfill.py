@@ -0,0 +1,227 @@
+import asyncio
+import bisect
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from config import BACKFILL_JOBS_PATH, BACKFILL_BATCH_SIZE
+from services.jobs import FINISHED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_FIELDS = (
+    "id", "status", "start_index", "end_index", "last_id", "end_id", "total",
+    "processed", "updated", "failures", "error", "cancel_requested",
+    "created_at", "updated_at",
+)
+
+
+# Progress of metadata backfills over the collection in id order. last_id
+# is the checkpoint: it only advances after a page has been written back, so
+# a resumed run repeats at most one page, and chunks inserted or deleted in
+# the meantime cannot shift it. end_id pins the end of a limited run.
+class BackfillStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS backfills (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                start_index INTEGER NOT NULL,
+                end_index INTEGER,
+                last_id TEXT,
+                end_id TEXT,
+                total INTEGER,
+                processed INTEGER NOT NULL DEFAULT 0,
+                updated INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def create(self, job_id: str, start_index: int, end_index: Optional[int], total: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO backfills (id, status, start_index, end_index, total, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, start_index, end_index, total, now, now)
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE backfills SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def increment(self, job_id: str, field: str, amount: int = 1) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE backfills SET {field} = {field} + ?, updated_at = ? WHERE id = ?",
+                (amount, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def checkpoint(self, job_id: str, last_id: str, processed: int, updated: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE backfills SET last_id = ?, processed = processed + ?, updated = updated + ?, "
+                "updated_at = ? WHERE id = ?",
+                (last_id, processed, updated, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def _row_to_job(self, row) -> Dict:
+        job = dict(zip(BACKFILL_FIELDS, row))
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(BACKFILL_FIELDS)} FROM backfills WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(BACKFILL_FIELDS)} FROM backfills ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def unfinished(self) -> List[Dict]:
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(BACKFILL_FIELDS)} FROM backfills WHERE status NOT IN ({placeholders}) "
+                "AND cancel_requested = 0 ORDER BY created_at",
+                FINISHED_STATUSES
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+
+# Rewrites chunk summaries/has_math for the whole collection (or a slice of
+# it) in the background, one Chroma page per step
+class MetadataBackfillManager:
+    def __init__(
+        self,
+        client,
+        store_path: str = BACKFILL_JOBS_PATH,
+        batch_size: int = BACKFILL_BATCH_SIZE,
+    ):
+        self.client = client
+        self.store = BackfillStore(store_path)
+        self.batch_size = batch_size
+        self._tasks = {}
+
+    def submit(self, limit: Optional[int] = None, start_index: int = 0) -> str:
+        job_id = uuid.uuid4().hex
+        end_index = start_index + limit if limit else None
+        count = self.client.chroma_collection.count()
+        total = max(min(end_index or count, count) - start_index, 0)
+        self.store.create(job_id, start_index, end_index, total)
+        self._start(job_id)
+        logger.info(f"Queued metadata backfill {job_id} ({total} chunks from {start_index})")
+        return job_id
+
+    def _start(self, job_id: str) -> None:
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id))
+
+    def resume_unfinished(self) -> List[str]:
+        # Picks up runs interrupted by a restart from their last checkpoint
+        resumed = []
+        for job in self.store.unfinished():
+            if job["id"] not in self._tasks:
+                self._start(job["id"])
+                resumed.append(job["id"])
+        if resumed:
+            logger.warning(f"Resuming {len(resumed)} interrupted metadata backfills")
+        return resumed
+
+    def resume(self, job_id: str) -> Optional[Dict]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in ("done", "cancelled") or job_id in self._tasks:
+            return job
+
+        self.store.update(job_id, status="queued", error=None)
+        self._start(job_id)
+        return self.store.get(job_id)
+
+    async def _run(self, job_id: str) -> None:
+        try:
+            job = self.store.get(job_id)
+            self.store.update(job_id, status="running")
+            ids = await asyncio.to_thread(self.client.list_ids)
+
+            if job["last_id"] is None:
+                # First run: turn the requested positions into id bounds once;
+                # "" sorts before every id
+                start_index = min(job["start_index"], len(ids))
+                window = ids[start_index:job["end_index"]]
+                last_id = ids[start_index - 1] if start_index > 0 else ""
+                end_id = window[-1] if window and job["end_index"] is not None else None
+                self.store.update(job_id, last_id=last_id, end_id=end_id)
+                job = self.store.get(job_id)
+
+            last_id, end_id = job["last_id"], job["end_id"]
+            start = bisect.bisect_right(ids, last_id)
+            stop = bisect.bisect_right(ids, end_id) if end_id is not None else len(ids)
+            if job["end_index"] is not None and end_id is None:
+                # The requested window was empty
+                stop = start
+
+            for page_start in range(start, stop, self.batch_size):
+                if self.store.get(job_id)["cancel_requested"]:
+                    self.store.update(job_id, status="cancelled")
+                    return
+
+                page = ids[page_start:min(page_start + self.batch_size, stop)]
+                result = await self.client.rewrite_metadata_page_async(page)
+                last_id = page[-1]
+                self.store.checkpoint(job_id, last_id, result["read"], result["updated"])
+
+            self.store.update(job_id, status="done")
+            logger.info(f"Metadata backfill {job_id} finished at id {last_id!r}")
+
+        # CancelledError is left alone: cancel() has already recorded it, and a
+        # run torn down by shutdown has to stay unfinished to be resumed
+        except Exception as e:
+            logger.error(f"Metadata backfill {job_id} failed: {e}")
+            self.store.update(job_id, status="failed", error=str(e))
+            self.store.increment(job_id, "failures")
+        finally:
+            self._tasks.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+
+        self.store.update(job_id, cancel_requested=1)
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        self.store.update(job_id, status="cancelled")
+
+        return self.store.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        return self.store.list(limit)
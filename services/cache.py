@@ -0,0 +1,456 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from config import PARSE_CACHE_PATH, PARSE_CACHE_MAX_BYTES, YOLO_MODEL_FILE
+
+logger = logging.getLogger(__name__)
+
+
+def sha256_file(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sha256_json(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# SQLite-backed key/value store with a byte budget and LRU eviction. Every
+# entry carries a tag so a whole generation of entries (e.g. the ones produced
+# by an old model) can be dropped with one statement.
+class DiskCache:
+    def __init__(self, path: str, max_bytes: int):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                tag TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_tag ON entries (tag)")
+        # Running byte total, kept in the same transactions as the entries so
+        # every process sharing the file sees the same number
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM entries")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def get_many(self, keys) -> Dict[str, bytes]:
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: bytes, tag: str = "") -> None:
+        self.set_many({key: value}, tag)
+
+    def _add_size(self, delta: int) -> None:
+        self._conn.execute("UPDATE totals SET size = size + ? WHERE id = 0", (delta,))
+
+    def _total_size(self) -> int:
+        return self._conn.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+
+    def set_many(self, items: Dict[str, bytes], tag: str = "") -> None:
+        if not items:
+            return
+        now = time.time()
+        keys = list(items)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            replaced = 0
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, tag, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                [(key, tag, value, len(value), now) for key, value in items.items()]
+            )
+            self._add_size(sum(len(value) for value in items.values()) - replaced)
+            self._evict()
+            self._conn.commit()
+
+    def _delete_where(self, condition: str, params: tuple) -> int:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            count, size = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE {condition}", params
+            ).fetchone()
+            self._conn.execute(f"DELETE FROM entries WHERE {condition}", params)
+            self._add_size(-size)
+            self._conn.commit()
+        return count
+
+    def delete(self, key: str) -> None:
+        self._delete_where("key = ?", (key,))
+
+    def invalidate_tag(self, tag: str) -> int:
+        return self._delete_where("tag = ?", (tag,))
+
+    def invalidate_except_tag(self, tag: str) -> int:
+        return self.invalidate_except_tags([tag])
+
+    def invalidate_except_tags(self, tags) -> int:
+        tags = list(tags)
+        return self._delete_where(f"tag NOT IN ({','.join('?' * len(tags))})", tuple(tags))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("UPDATE totals SET size = 0 WHERE id = 0")
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._total_size()
+        if total <= self.max_bytes:
+            return
+
+        freed = 0
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if total - freed <= self.max_bytes:
+                break
+            stale.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+        self._add_size(-freed)
+        logger.info(f"Evicted {len(stale)} cache entries ({freed} bytes) from {self.path}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = self._total_size()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Per-page parsed text keyed by PDF content hash and parser configuration
+class ParseCache:
+    def __init__(self, path: str, max_bytes: int, model_fingerprint: str):
+        self.store = DiskCache(path, max_bytes)
+        self.model_fingerprint = model_fingerprint
+
+    def config_key(self, **parser_config) -> str:
+        return sha256_json({**parser_config, "model": self.model_fingerprint})
+
+    def _key(self, pdf_hash: str, config_key: str, page_num: int) -> str:
+        return f"{pdf_hash}:{config_key}:{page_num}"
+
+    def get_page(self, pdf_hash: str, config_key: str, page_num: int) -> Optional[str]:
+        value = self.store.get(self._key(pdf_hash, config_key, page_num))
+        return value.decode("utf-8") if value is not None else None
+
+    def set_page(self, pdf_hash: str, config_key: str, page_num: int, text: str) -> None:
+        self.store.set(
+            self._key(pdf_hash, config_key, page_num),
+            text.encode("utf-8"),
+            tag=self.model_fingerprint
+        )
+
+    def invalidate_stale_models(self) -> int:
+        return self.store.invalidate_except_tag(self.model_fingerprint)
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def stats(self) -> Dict:
+        return {**self.store.stats(), "model": self.model_fingerprint}
+
+
+_parse_cache = None
+_parse_cache_lock = threading.Lock()
+
+def get_parse_cache() -> ParseCache:
+    global _parse_cache
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            # The model file hash is part of every key, so swapping the weights
+            # misses the old entries; drop them right away to reclaim the space
+            _parse_cache = ParseCache(PARSE_CACHE_PATH, PARSE_CACHE_MAX_BYTES, sha256_file(YOLO_MODEL_FILE))
+            dropped = _parse_cache.invalidate_stale_models()
+            if dropped:
+                logger.info(f"Dropped {dropped} parse cache entries from a previous model")
+    return _parse_cache
+
+
+# Embeddings keyed by (model, dimensions, whitespace-normalized text), stored as float32
+class EmbeddingCache:
+    def __init__(self, path: str, max_bytes: int, model: str, dimensions: Optional[int] = None):
+        self.store = DiskCache(path, max_bytes)
+        self.model = model
+        self.dimensions = dimensions
+
+    def key(self, text: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.model}\0{self.dimensions}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts) -> Dict[str, list]:
+        found = self.store.get_many({self.key(text) for text in texts})
+        return {key: array("f", value).tolist() for key, value in found.items()}
+
+    def set_many(self, embeddings: Dict[str, list]) -> None:
+        self.store.set_many(
+            {key: array("f", embedding).tobytes() for key, embedding in embeddings.items()},
+            tag=self.model
+        )
+
+    def stats(self) -> Dict:
+        return {**self.store.stats(), "model": self.model, "dimensions": self.dimensions}
+
+
+# Summaries keyed by (chunk hash, prompt fingerprint, model, temperature).
+# Each entry is keyed and tagged with the fingerprint of the prompt that
+# actually produced it (single or batch), so editing one prompt only drops
+# the summaries that prompt wrote.
+class SummaryCache:
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        prompt_fingerprints: Dict[str, str],
+        model: str,
+        temperature: float,
+    ):
+        self.store = DiskCache(path, max_bytes)
+        self.prompt_fingerprints = prompt_fingerprints
+        self.model = model
+        self.temperature = temperature
+        # Counted per text, not per key looked up
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str, prompt: str) -> str:
+        chunk_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return sha256_json([chunk_hash, self.prompt_fingerprints[prompt], self.model, self.temperature])
+
+    def get_many(self, texts) -> Dict[str, str]:
+        # A summary from any current prompt will do; returns text -> summary
+        keys = {self.key(text, prompt): text for text in texts for prompt in self.prompt_fingerprints}
+        found = self.store.get_many(keys)
+        summaries = {keys[key]: value.decode("utf-8") for key, value in found.items()}
+        texts = set(keys.values())
+        self.hits += len(summaries)
+        self.misses += len(texts) - len(summaries)
+        return summaries
+
+    def set_many(self, summaries: Dict[str, str], prompt: str) -> None:
+        self.store.set_many(
+            {self.key(text, prompt): summary.encode("utf-8") for text, summary in summaries.items()},
+            tag=self.prompt_fingerprints[prompt]
+        )
+
+    def invalidate_stale_prompts(self) -> int:
+        return self.store.invalidate_except_tags(self.prompt_fingerprints.values())
+
+    def stats(self) -> Dict:
+        return {
+            **self.store.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "prompts": self.prompt_fingerprints,
+            "model": self.model,
+        }
+
+
+# In-process LRU with an optional TTL, for small hot caches on the query path
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Answers keyed by query embedding rather than query text: a lookup returns the
+# closest stored entry within the same scope (prompt, n_results) whose cosine
+# similarity clears the threshold. Entries remember a fingerprint of the chunks
+# the answer was built from so the caller can check they are still current.
+class SemanticAnswerCache:
+    def __init__(self, maxsize: int, threshold: float):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+    def _rebuild_matrix(self) -> None:
+        self._matrix_keys = list(self._entries)
+        if self._matrix_keys:
+            self._matrix = np.stack([self._entries[key]["embedding"] for key in self._matrix_keys])
+        else:
+            self._matrix = None
+
+    def lookup(self, embedding, scope: str) -> Optional[Dict]:
+        query = np.array(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            if self._matrix is None and self._entries:
+                self._rebuild_matrix()
+            if self._matrix is not None:
+                similarities = self._matrix @ query
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.threshold:
+                        break
+                    key = self._matrix_keys[i]
+                    entry = self._entries[key]
+                    if entry["scope"] == scope:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return dict(entry, key=key, similarity=float(similarities[i]))
+            self.misses += 1
+            return None
+
+    def store(self, embedding, scope: str, ids, fingerprint: str, value) -> None:
+        vector = np.array(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            self._entries[self._next_key] = {
+                "embedding": vector,
+                "scope": scope,
+                "ids": list(ids),
+                "fingerprint": fingerprint,
+                "value": value,
+            }
+            self._next_key += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def discard(self, key) -> None:
+        # Called when a candidate fails the caller's freshness check; it was
+        # counted as a hit by lookup() but served nothing
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._matrix = None
+            self.hits -= 1
+            self.misses += 1
+            self.stale += 1
+
+    def invalidate_ids(self, ids) -> int:
+        ids = set(ids)
+        with self._lock:
+            doomed = [key for key, entry in self._entries.items() if ids.intersection(entry["ids"])]
+            for key in doomed:
+                del self._entries[key]
+            if doomed:
+                self._matrix = None
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
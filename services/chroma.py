@@ -2,21 +2,72 @@ from llama_index.core import VectorStoreIndex, StorageContext, Settings
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.schema import TextNode
+from llama_index.core.schema import MetadataMode, QueryBundle, TextNode
 
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 
 import chromadb
-from typing import List, Optional, Dict, Callable
+from typing import AsyncIterator, Iterator, List, Optional, Dict, Callable, Tuple
+from contextlib import aclosing
+import hashlib
+import os
+import json
 import re
 import logging
 import asyncio
-from config import OPENAI_API_KEY
+from config import (
+    OPENAI_API_KEY, EMBED_BATCH_SIZE, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES,
+    SUMMARY_BATCH_SIZE, SUMMARY_BATCH_TOKEN_BUDGET,
+    SUMMARY_CACHE_PATH, SUMMARY_CACHE_MAX_BYTES, SUMMARY_PROMPT_VERSION,
+    LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE,
+    LIMITER_MAX_CONCURRENCY, QUERY_EMBEDDING_CACHE_SIZE, QUERY_RESULT_CACHE_SIZE, QUERY_RESULT_CACHE_TTL,
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_SIMILARITY, QA_CONTEXT_TOKEN_BUDGET, STATS_PATH
+)
+from services.limiter import AdaptiveLimiter, estimate_tokens
+from services.chunking import MathAwareChunker, is_math_block
+from services.stats import StatsStore
+from services.cache import EmbeddingCache, LRUCache, SemanticAnswerCache, SummaryCache, sha256_json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Metadata that depends on where a chunk sits or when it was ingested rather
+# than on what it says. Keeping it out of the embedded text lets the same
+# chunk reuse its cached embedding at another position, in another document
+# or after a re-upload. The summary stays in: it is part of what retrieval
+# matches on, and cached summaries keep it stable for unchanged text.
+VOLATILE_EMBED_METADATA_KEYS = [
+    "chunk_index", "total_chunks", "chunk_length", "source", "doc_id_prefix", "content_hash"
+]
+
+
+# Query filters -> native Chroma where clause; None means no filtering
+def build_where(
+    source: Optional[str] = None,
+    doc_id_prefix: Optional[str] = None,
+    has_math: Optional[bool] = None,
+    chunk_index_min: Optional[int] = None,
+    chunk_index_max: Optional[int] = None
+) -> Optional[Dict]:
+    conditions = []
+    if source is not None:
+        conditions.append({"source": {"$eq": source}})
+    if doc_id_prefix is not None:
+        conditions.append({"doc_id_prefix": {"$eq": doc_id_prefix}})
+    if has_math is not None:
+        conditions.append({"has_math": {"$eq": has_math}})
+    if chunk_index_min is not None:
+        conditions.append({"chunk_index": {"$gte": chunk_index_min}})
+    if chunk_index_max is not None:
+        conditions.append({"chunk_index": {"$lte": chunk_index_max}})
+    
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
 
 class ChromaDBClient:
     def __init__(
@@ -29,6 +80,11 @@ class ChromaDBClient:
         max_tokens: int = 512,
         temperature: float = 0.3,
         max_concurrent_requests: int = 10,  
+        embed_dimensions: Optional[int] = None,
+        embed_batch_size: int = EMBED_BATCH_SIZE,
+        summary_batch_size: int = SUMMARY_BATCH_SIZE,
+        summary_batch_token_budget: int = SUMMARY_BATCH_TOKEN_BUDGET,
+        context_token_budget: int = QA_CONTEXT_TOKEN_BUDGET,
     ):
         logger.info(f"Initializing ChromaDBClient with collection: {collection_name}")
         
@@ -38,10 +94,18 @@ class ChromaDBClient:
             name=collection_name
         )
         
-        Settings.embed_model = OpenAIEmbedding(
+        self.embed_model = OpenAIEmbedding(
             model=openai_model,
+            dimensions=embed_dimensions,
+            embed_batch_size=embed_batch_size,
+            max_retries=0,
             api_key=OPENAI_API_KEY
         )
+        Settings.embed_model = self.embed_model
+        self.embed_batch_size = embed_batch_size
+        self.embedding_cache = EmbeddingCache(
+            EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES, openai_model, embed_dimensions
+        )
         
         self.vector_store = ChromaVectorStore(chroma_collection=self.chroma_collection)
         self.storage_context = StorageContext.from_defaults(vector_store=self.vector_store)
@@ -50,17 +114,30 @@ class ChromaDBClient:
             storage_context=self.storage_context
         )
         
+        self._retrievers = {}
+        self._qa_chains = {}
+        
+        # Bumped by every write; result cache keys include it so nothing
+        # computed against an older collection can be served
+        self.generation = 0
+        self.query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+        self.query_result_cache = LRUCache(QUERY_RESULT_CACHE_SIZE, ttl=QUERY_RESULT_CACHE_TTL)
+        self.answer_cache = SemanticAnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_SIMILARITY)
+        
         self.text_splitter = SentenceSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             paragraph_separator="\n\n",
             secondary_chunking_regex="[^,.;。？！]+[,.;。？！]?"
         )
+        self.chunker = MathAwareChunker(self.text_splitter)
         
+        # Retries are owned by the adaptive limiter, not the OpenAI client
         self.llm = ChatOpenAI(
             model="gpt-4o-mini",
             temperature=temperature,
             max_tokens=max_tokens,
+            max_retries=0,
             openai_api_key=OPENAI_API_KEY
         )
         
@@ -79,62 +156,376 @@ Summary:""")
         
         self.summary_chain = self.summary_prompt | self.llm
         
-        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self.batch_summary_prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are an expert at creating concise summaries of mathematical and technical content.
+Preserve key formulas, theorems, and technical terms in your summaries."""),
+            ("user", """Generate a concise summary (max 30 words) of each of the following sections separately.
+For mathematical content, include key concepts and formulas.
+
+Return a JSON object that maps every section id to its summary, for example {{"1": "...", "2": "..."}}.
+
+{sections}""")
+        ])
+        
+        # Each section gets the single-summary budget plus room for its JSON
+        # key, quotes and escaped LaTeX backslashes, so a full batch of
+        # Cyrillic or formula-heavy summaries is not cut off mid-object
+        self.summary_section_tokens = max_tokens + 32
+        self.batch_summary_llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=temperature,
+            max_tokens=self.summary_section_tokens * summary_batch_size + 64,
+            max_retries=0,
+            openai_api_key=OPENAI_API_KEY
+        ).bind(response_format={"type": "json_object"})
+        self.batch_summary_chain = self.batch_summary_prompt | self.batch_summary_llm
+        self.summary_batch_size = summary_batch_size
+        self.summary_batch_token_budget = summary_batch_token_budget
+        
+        # An edit to a summary prompt changes that prompt's fingerprint and
+        # misses only the entries it wrote; a SUMMARY_PROMPT_VERSION bump
+        # changes both
+        self.summary_cache = SummaryCache(
+            SUMMARY_CACHE_PATH,
+            SUMMARY_CACHE_MAX_BYTES,
+            {
+                "single": sha256_json([SUMMARY_PROMPT_VERSION, self.summary_prompt.pretty_repr()]),
+                "batch": sha256_json([SUMMARY_PROMPT_VERSION, self.batch_summary_prompt.pretty_repr()]),
+            },
+            model="gpt-4o-mini",
+            temperature=temperature
+        )
+        dropped = self.summary_cache.invalidate_stale_prompts()
+        if dropped:
+            logger.info(f"Dropped {dropped} cached summaries from a previous prompt version")
+        
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_tokens = max_tokens
+        self.llm_limiter = AdaptiveLimiter(
+            "llm",
+            requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+            initial_concurrency=max_concurrent_requests,
+            max_concurrency=LIMITER_MAX_CONCURRENCY
+        )
+        self.embed_limiter = AdaptiveLimiter(
+            "embeddings",
+            requests_per_minute=EMBED_REQUESTS_PER_MINUTE,
+            tokens_per_minute=EMBED_TOKENS_PER_MINUTE,
+            initial_concurrency=max_concurrent_requests,
+            max_concurrency=LIMITER_MAX_CONCURRENCY
+        )
         
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        
+        self.context_token_budget = context_token_budget
+        self.context_stats = {
+            "requests": 0,
+            "retrieved_chunks": 0,
+            "passages": 0,
+            "dropped_passages": 0,
+            "naive_context_tokens": 0,
+            "context_tokens": 0,
+        }
+        
+        # Collections that predate the stats store get counted once
+        self.stats_store = StatsStore(STATS_PATH, f"{os.path.abspath(path)}:{collection_name}")
+        if not self.stats_store.is_initialized():
+            self.rebuild_stats()
 
     def _is_math_block(self, text: str) -> bool:
-        latex_patterns = [r'\$\$.*?\$\$', r'\$.*?\$', r'\\[a-zA-Z]+', r'\\frac', r'\\int', r'\\sum']
-        for pattern in latex_patterns:
-            if re.search(pattern, text):
-                return True
-        
-        math_chars = ['∑', '∫', '∂', '∇', '√', '≠', '≤', '≥', '∈', '⊂', '∞']
-        return any(char in text for char in math_chars)
+        return is_math_block(text)
 
     def _smart_chunk_text(self, text: str) -> List[str]:
-        math_blocks = []
-        pattern = r'\$\$[\s\S]*?\$\$|\$[^\$]+?\$'
-        
-        def replace_math(match):
-            idx = len(math_blocks)
-            math_blocks.append(match.group(0))
-            return f"__MATH_BLOCK_{idx}__"
-        
-        protected_text = re.sub(pattern, replace_math, text)
+        return self.chunker.split(text)
+
+    async def _generate_summary_async(self, text: str, prev_summaries: List[str] = None) -> str:
+        try:
+            context = ""
+            if prev_summaries:
+                recent = prev_summaries[-3:]
+                context = "Previous sections:\n- " + "\n- ".join(recent) + "\n\n"
+            
+            inputs = {"context": context, "text": text[:2000]}
+            response = await self.llm_limiter.run(
+                lambda: self.summary_chain.ainvoke(inputs),
+                tokens=estimate_tokens(context + inputs["text"]) + self.max_tokens
+            )
+            
+            summary = response.content.strip()
+            logger.debug(f"Generated summary: {summary[:50]}...")
+            return summary
+            
+        except Exception as e:
+            logger.error(f"Summary generation failed: {e}")
+            return self._fallback_summary(text)
+
+    def _fallback_summary(self, text: str) -> str:
+        words = text.split()[:30]
+        return " ".join(words) + "..."
+
+    def _pack_summary_batches(self, texts: List[str]) -> List[List[int]]:
+        # Rough 4 chars/token estimate; good enough to keep requests under budget
+        batches = []
+        current = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = len(text[:2000]) // 4 + 8
+            if current and (
+                len(current) >= self.summary_batch_size
+                or current_tokens + tokens > self.summary_batch_token_budget
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _parse_batch_summaries(self, content: str, count: int) -> Optional[List[str]]:
+        content = content.strip()
+        if content.startswith("```"):
+            content = content.strip("`").removeprefix("json").strip()
+        try:
+            parsed = json.loads(content)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(parsed, dict):
+            return None
+
+        summaries = []
+        for section_id in range(1, count + 1):
+            summary = parsed.get(str(section_id))
+            if not isinstance(summary, str) or not summary.strip():
+                return None
+            summaries.append(summary.strip())
+        return summaries
+
+    async def _summarize_batch_async(self, texts: List[str]) -> Tuple[List[str], List[str]]:
+        # Also returns which prompt ("single" or "batch") each summary came from
+        if len(texts) == 1:
+            return ["single"], [await self._generate_summary_async(texts[0])]
+
+        sections = "\n\n".join(f"[{i + 1}]\n{text[:2000]}" for i, text in enumerate(texts))
+        summaries = None
+        try:
+            response = await self.llm_limiter.run(
+                lambda: self.batch_summary_chain.ainvoke({"sections": sections}),
+                tokens=estimate_tokens(sections) + self.summary_section_tokens * len(texts)
+            )
+            if response.response_metadata.get("finish_reason") == "length":
+                # Out of output tokens: two half batches still beat K single calls
+                logger.warning(f"Batched summary reply truncated, splitting a batch of {len(texts)}")
+                half = len(texts) // 2
+                first, second = await asyncio.gather(
+                    self._summarize_batch_async(texts[:half]),
+                    self._summarize_batch_async(texts[half:])
+                )
+                return first[0] + second[0], first[1] + second[1]
+            summaries = self._parse_batch_summaries(response.content, len(texts))
+        except Exception as e:
+            logger.error(f"Batched summary generation failed: {e}")
+
+        if summaries is None:
+            logger.warning(f"Falling back to single-chunk summaries for a batch of {len(texts)}")
+            summaries = await asyncio.gather(*[self._generate_summary_async(text) for text in texts])
+            return ["single"] * len(texts), list(summaries)
+        return ["batch"] * len(texts), summaries
+
+    async def _generate_summaries_async(self, texts: List[str]) -> List[str]:
+        cached = self.summary_cache.get_many(texts)
+        summaries = [cached.get(text) for text in texts]
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+
+        batches = self._pack_summary_batches([texts[i] for i in missing])
+        logger.info(
+            f"Summarizing {len(texts)} chunks: {len(texts) - len(missing)} cached, "
+            f"{len(missing)} in {len(batches)} requests"
+        )
+
+        results = await asyncio.gather(*[
+            self._summarize_batch_async([texts[missing[i]] for i in batch]) for batch in batches
+        ])
+
+        generated = {"single": {}, "batch": {}}
+        for batch, (prompts, batch_summaries) in zip(batches, results):
+            for i, prompt, summary in zip(batch, prompts, batch_summaries):
+                text = texts[missing[i]]
+                summaries[missing[i]] = summary
+                # Never cache the first-30-words fallback used when a call fails
+                if summary != self._fallback_summary(text):
+                    generated[prompt][text] = summary
+        for prompt, prompt_summaries in generated.items():
+            self.summary_cache.set_many(prompt_summaries, prompt)
+        return summaries
+
+    def _split_cached_embeddings(self, nodes: List[TextNode]) -> Dict[str, List[TextNode]]:
+        # Nodes that already carry a vector (reused from Chroma) need nothing
+        nodes = [node for node in nodes if node.embedding is None]
+        texts = {node.node_id: node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes}
+        cached = self.embedding_cache.get_many(texts.values())
+
+        misses = {}
+        for node in nodes:
+            key = self.embedding_cache.key(texts[node.node_id])
+            if key in cached:
+                node.embedding = cached[key]
+            else:
+                misses.setdefault(key, (texts[node.node_id], []))[1].append(node)
+
+        hits = sum(1 for node in nodes if node.embedding is not None)
+        logger.info(f"Embedding cache: {hits} hits, {len(nodes) - hits} misses ({len(misses)} unique texts to embed)")
+        return misses
+
+    def _store_embeddings(self, misses: Dict, keys: List[str], embeddings: List[List[float]]) -> None:
+        for key, embedding in zip(keys, embeddings):
+            for node in misses[key][1]:
+                node.embedding = embedding
+        self.embedding_cache.set_many(dict(zip(keys, embeddings)))
+
+    async def _embed_nodes_async(self, nodes: List[TextNode]) -> None:
+        misses = self._split_cached_embeddings(nodes)
+        keys = list(misses)
+        for start in range(0, len(keys), self.embed_batch_size):
+            batch_keys = keys[start:start + self.embed_batch_size]
+            batch_texts = [misses[key][0] for key in batch_keys]
+            embeddings = await self.embed_limiter.run(
+                lambda: self.embed_model.aget_text_embedding_batch(batch_texts),
+                tokens=sum(estimate_tokens(text) for text in batch_texts)
+            )
+            self._store_embeddings(misses, batch_keys, embeddings)
+
+    def _embed_nodes(self, nodes: List[TextNode]) -> None:
+        misses = self._split_cached_embeddings(nodes)
+        keys = list(misses)
+        for start in range(0, len(keys), self.embed_batch_size):
+            batch_keys = keys[start:start + self.embed_batch_size]
+            batch_texts = [misses[key][0] for key in batch_keys]
+            embeddings = self.embed_limiter.run_sync(
+                lambda: self.embed_model.get_text_embedding_batch(batch_texts),
+                tokens=sum(estimate_tokens(text) for text in batch_texts)
+            )
+            self._store_embeddings(misses, batch_keys, embeddings)
+
+    def get_embedding_cache_stats(self) -> Dict:
+        return self.embedding_cache.stats()
+
+    def get_limiter_stats(self) -> Dict:
+        return {"llm": self.llm_limiter.stats(), "embeddings": self.embed_limiter.stats()}
+
+    def get_summary_cache_stats(self) -> Dict:
+        return self.summary_cache.stats()
+
+    def _build_chunk_node(
+        self,
+        doc_id_prefix: str,
+        chunk_index: int,
+        chunk: str,
+        summary: Optional[str],
+        metadata: Optional[Dict] = None,
+        total_chunks: int = 0
+    ) -> TextNode:
+        chunk_metadata = metadata.copy() if metadata else {}
+        chunk_metadata.update({
+            "chunk_index": chunk_index,
+            "total_chunks": total_chunks,
+            "doc_id_prefix": doc_id_prefix,
+            "has_math": self._is_math_block(chunk),
+            "chunk_length": len(chunk)
+        })
         
-        chunks = self.text_splitter.split_text(protected_text)
+        chunk_metadata["content_hash"] = self._content_hash(chunk)
         
-        restored_chunks = []
-        for chunk in chunks:
-            for idx, math_block in enumerate(math_blocks):
-                chunk = chunk.replace(f"__MATH_BLOCK_{idx}__", math_block)
-            restored_chunks.append(chunk)
+        if summary:
+            chunk_metadata["summary"] = summary
         
-        return restored_chunks
+        return TextNode(
+            text=chunk,
+            id_=f"{doc_id_prefix}_chunk_{chunk_index}",
+            metadata=chunk_metadata,
+            excluded_embed_metadata_keys=list(VOLATILE_EMBED_METADATA_KEYS),
+            excluded_llm_metadata_keys=["content_hash"]
+        )
 
-    async def _generate_summary_async(self, text: str, prev_summaries: List[str] = None) -> str:
-        async with self.semaphore: 
-            try:
-                context = ""
-                if prev_summaries:
-                    recent = prev_summaries[-3:]
-                    context = "Previous sections:\n- " + "\n- ".join(recent) + "\n\n"
-                
-                response = await self.summary_chain.ainvoke({
-                    "context": context,
-                    "text": text[:2000]
-                })
-                
-                summary = response.content.strip()
-                logger.debug(f"Generated summary: {summary[:50]}...")
-                return summary
-                
-            except Exception as e:
-                logger.error(f"Summary generation failed: {e}")
-                words = text.split()[:30]
-                return " ".join(words) + "..."
+    def _content_hash(self, chunk: str) -> str:
+        return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+    def _reuse_stored_embeddings(self, nodes: List[TextNode], existing: Dict[str, Dict]) -> int:
+        # Chunk ids are positional, so a chunk that only shifted gets a new id;
+        # find it by content hash and carry its stored vector over
+        by_hash = {}
+        for chunk_id, version in existing.items():
+            if version["content_hash"]:
+                by_hash.setdefault(version["content_hash"], chunk_id)
+        sources = {
+            node.node_id: by_hash[node.metadata["content_hash"]]
+            for node in nodes
+            if node.embedding is None and node.metadata.get("content_hash") in by_hash
+        }
+        if not sources:
+            return 0
+
+        # existing is a snapshot from the start of the run: by now an earlier
+        # micro-batch may have replaced the source id with other text, so a
+        # vector is only reused while the stored content hash still matches.
+        # The summary is embedded too, so it has to match as well.
+        stored = self.chroma_collection.get(ids=list(set(sources.values())), include=["embeddings", "metadatas"])
+        embeddings = {
+            chunk_id: (embedding, chunk_metadata or {})
+            for chunk_id, embedding, chunk_metadata in zip(stored["ids"], stored["embeddings"], stored["metadatas"])
+        }
+        reused = 0
+        for node in nodes:
+            embedding, stored_metadata = embeddings.get(sources.get(node.node_id), (None, {}))
+            if (
+                embedding is not None
+                and stored_metadata.get("content_hash") == node.metadata["content_hash"]
+                and stored_metadata.get("summary") == node.metadata.get("summary")
+            ):
+                node.embedding = [float(value) for value in embedding]
+                reused += 1
+        return reused
+
+    def _load_chunk_versions(self, doc_id_prefix: str, page_size: int = 1000) -> Dict[str, Dict]:
+        versions = {}
+        offset = 0
+        while True:
+            page = self.chroma_collection.get(
+                where={"doc_id_prefix": doc_id_prefix},
+                include=["metadatas"],
+                limit=page_size,
+                offset=offset
+            )
+            for chunk_id, chunk_metadata in zip(page["ids"], page["metadatas"]):
+                versions[chunk_id] = {
+                    "content_hash": (chunk_metadata or {}).get("content_hash"),
+                    "summary": (chunk_metadata or {}).get("summary"),
+                }
+            if len(page["ids"]) < page_size:
+                return versions
+            offset += page_size
+
+    def _patch_metadata(self, chunk_metadata: Dict, fields: Dict) -> Dict:
+        # Patch both the flat metadata and the serialized node the vector store rebuilds nodes from
+        chunk_metadata.update(fields)
+        if "_node_content" in chunk_metadata:
+            node_content = json.loads(chunk_metadata["_node_content"])
+            node_content["metadata"].update(fields)
+            chunk_metadata["_node_content"] = json.dumps(node_content)
+        return chunk_metadata
+
+    def _update_stored_metadata(self, ids: List[str], fields: Dict, batch_size: int = 500) -> None:
+        for start in range(0, len(ids), batch_size):
+            stored = self.chroma_collection.get(ids=ids[start:start + batch_size], include=["metadatas"])
+
+            metadatas = [self._patch_metadata(chunk_metadata, fields) for chunk_metadata in stored["metadatas"]]
+
+            if stored["ids"]:
+                self.chroma_collection.update(ids=stored["ids"], metadatas=metadatas)
+                self._mark_collection_changed()
 
     async def add_document_chunks_async(
         self, 
@@ -149,49 +540,79 @@ Summary:""")
             chunks = self._smart_chunk_text(text)
             logger.info(f"Split into {len(chunks)} chunks")
             
+            existing = self._load_chunk_versions(doc_id_prefix)
+            known_summaries = {
+                version["content_hash"]: version["summary"]
+                for version in existing.values()
+                if version["content_hash"] and version["summary"]
+            }
+            known_hashes = {version["content_hash"] for version in existing.values() if version["content_hash"]}
+            
+            changed = []
+            unchanged_ids = []
+            for i, chunk in enumerate(chunks):
+                chunk_id = f"{doc_id_prefix}_chunk_{i+1}"
+                if existing.get(chunk_id, {}).get("content_hash") == self._content_hash(chunk):
+                    unchanged_ids.append(chunk_id)
+                else:
+                    changed.append((i, chunk))
+            
+            new_ids = {f"{doc_id_prefix}_chunk_{i+1}" for i in range(len(chunks))}
+            stale_ids = [chunk_id for chunk_id in existing if chunk_id not in new_ids]
+            moved = sum(1 for _, chunk in changed if self._content_hash(chunk) in known_hashes)
+            logger.info(
+                f"Diff for {doc_id_prefix}: {len(unchanged_ids)} unchanged, {moved} moved, "
+                f"{len(changed) - moved} changed, {len(stale_ids)} removed"
+            )
+            
             nodes = []
             
             if generate_summaries:
-                logger.info(f"Generating {len(chunks)} summaries in parallel...")
-                
-                summary_tasks = []
-                prev_summaries = []
+                # Chunks that only moved keep the summary they already have
+                to_summarize = [
+                    (i, chunk) for i, chunk in changed
+                    if self._content_hash(chunk) not in known_summaries
+                ]
+                logger.info(f"Generating {len(to_summarize)} summaries in batches...")
                 
-                for i, chunk in enumerate(chunks):
-                    task = self._generate_summary_async(chunk, prev_summaries.copy())
-                    summary_tasks.append(task)
-
-                summaries = await asyncio.gather(*summary_tasks)
-                logger.info(f"Generated {len(summaries)} summaries")
+                generated = dict(zip(
+                    (self._content_hash(chunk) for _, chunk in to_summarize),
+                    await self._generate_summaries_async([chunk for _, chunk in to_summarize])
+                ))
+                logger.info(f"Generated {len(generated)} summaries")
+                summaries = [
+                    generated.get(self._content_hash(chunk)) or known_summaries.get(self._content_hash(chunk))
+                    for _, chunk in changed
+                ]
             else:
-                summaries = [None] * len(chunks)
+                summaries = [None] * len(changed)
             
-            for i, (chunk, summary) in enumerate(zip(chunks, summaries)):
-                chunk_id = f"{doc_id_prefix}_chunk_{i+1}"
-                
-                chunk_metadata = metadata.copy() if metadata else {}
-                chunk_metadata.update({
-                    "chunk_index": i + 1,
-                    "total_chunks": len(chunks),
-                    "doc_id_prefix": doc_id_prefix,
-                    "has_math": self._is_math_block(chunk),
-                    "chunk_length": len(chunk)
-                })
-                
-                if summary:
-                    chunk_metadata["summary"] = summary
-                
-                node = TextNode(
-                    text=chunk,
-                    id_=chunk_id,
-                    metadata=chunk_metadata
-                )
-                nodes.append(node)
+            for (i, chunk), summary in zip(changed, summaries):
+                nodes.append(self._build_chunk_node(
+                    doc_id_prefix, i + 1, chunk, summary, metadata, total_chunks=len(chunks)
+                ))
+            
+            # Embed before touching the stored version, so a failed embedding
+            # call leaves the previous document intact
+            if nodes:
+                self._reuse_stored_embeddings(nodes, existing)
+                await self._embed_nodes_async(nodes)
+            
+            written = {"inserted_ids": [], "replaced_rows": []}
+            try:
+                self._write_chunk_nodes(nodes, existing, written)
+            except BaseException:
+                self._rollback_chunk_writes(written)
+                raise
+            
+            self._finish_chunk_writes(
+                doc_id_prefix, existing, len(chunks),
+                unchanged_ids if len(chunks) != len(existing) else []
+            )
             
-            self.index.insert_nodes(nodes)
             logger.info(f"Successfully added {len(nodes)} nodes")
             
-            return len(nodes)
+            return len(chunks)
             
         except Exception as e:
             logger.error(f"Failed to add document chunks: {e}")
@@ -233,11 +654,13 @@ Summary:""")
                 node = TextNode(
                     text=chunk,
                     id_=chunk_id,
-                    metadata=chunk_metadata
+                    metadata=chunk_metadata,
+                    excluded_embed_metadata_keys=list(VOLATILE_EMBED_METADATA_KEYS)
                 )
                 nodes.append(node)
             
-            self.index.insert_nodes(nodes)
+            await self._embed_nodes_async(nodes)
+            self._insert_nodes(nodes)
             logger.info(f"Successfully added {len(nodes)} nodes")
             
             return len(nodes)
@@ -263,7 +686,8 @@ Summary:""")
                 metadata=node_metadata
             )
             
-            self.index.insert_nodes([node])
+            self._embed_nodes([node])
+            self._insert_nodes([node])
             logger.info(f"Successfully added document: {doc_id}")
             
         except Exception as e:
@@ -274,11 +698,202 @@ Summary:""")
         try:
             logger.info(f"Querying: {query_text[:50]}...")
             
+            cache_key = self._result_cache_key(query_text, n_results, filters)
+            results = self.query_result_cache.get(cache_key)
+            if results is not None:
+                return results
+            
+            retriever = self._get_retriever(n_results, filters)
+            nodes = retriever.retrieve(
+                QueryBundle(query_str=query_text, embedding=self._get_query_embedding(query_text))
+            )
+            
+            results = {
+                "ids": [[node.node_id for node in nodes]],
+                "documents": [[node.text for node in nodes]],
+                "metadatas": [[node.metadata for node in nodes]],
+                "distances": [[node.score if node.score else 0.0 for node in nodes]]
+            }
+            
+            logger.info(f"Found {len(nodes)} results")
+            self.query_result_cache.set(cache_key, results)
+            return results
+            
+        except Exception as e:
+            logger.error(f"Query failed: {e}")
+            raise
+
+    def _mark_collection_changed(self) -> None:
+        self.generation += 1
+        self.query_result_cache.clear()
+
+    def _stats_row(self, chunk_id: str, text: Optional[str], metadata: Optional[Dict]) -> tuple:
+        metadata = metadata or {}
+        return (
+            chunk_id,
+            metadata.get("doc_id_prefix", "unknown"),
+            bool(metadata.get("has_math", False)),
+            len((text or "").encode("utf-8"))
+        )
+
+    def _insert_nodes(self, nodes: List[TextNode]) -> None:
+        self.index.insert_nodes(nodes)
+        self.stats_store.upsert([self._stats_row(node.node_id, node.text, node.metadata) for node in nodes])
+        self._mark_collection_changed()
+
+    def _fetch_rows(self, ids: List[str]) -> Dict:
+        return self.chroma_collection.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+
+    def _restore_rows(self, rows: Dict) -> None:
+        if not rows["ids"]:
+            return
+        self.chroma_collection.add(
+            ids=rows["ids"],
+            embeddings=rows["embeddings"],
+            documents=rows["documents"],
+            metadatas=rows["metadatas"]
+        )
+        self.stats_store.upsert([
+            self._stats_row(chunk_id, text, chunk_metadata)
+            for chunk_id, text, chunk_metadata in zip(rows["ids"], rows["documents"], rows["metadatas"])
+        ])
+        self._mark_collection_changed()
+
+    def _write_chunk_nodes(self, nodes: List[TextNode], existing: Dict[str, Dict], written: Dict) -> None:
+        # Chroma ignores add() for IDs that already exist, so replaced chunks go
+        # first. Every step is recorded in written before it happens, so
+        # _rollback_chunk_writes can undo a write that fails halfway.
+        replaced_ids = [node.node_id for node in nodes if node.node_id in existing]
+        if replaced_ids:
+            written["replaced_rows"].append(self._fetch_rows(replaced_ids))
+            self._delete_ids(replaced_ids)
+        written["inserted_ids"].extend(node.node_id for node in nodes)
+        if nodes:
+            self._insert_nodes(nodes)
+
+    def _rollback_chunk_writes(self, written: Dict) -> None:
+        # Drop the new chunks and put back the versions they replaced
+        if written["inserted_ids"]:
+            self._delete_ids(written["inserted_ids"])
+        for rows in written["replaced_rows"]:
+            self._restore_rows(rows)
+
+    def _finish_chunk_writes(
+        self,
+        doc_id_prefix: str,
+        existing: Dict[str, Dict],
+        total_chunks: int,
+        kept_ids: List[str]
+    ) -> List[str]:
+        # Only once the new version is fully stored: remove the positions it no
+        # longer has and bring total_chunks up to date on the chunks kept
+        new_ids = {f"{doc_id_prefix}_chunk_{i + 1}" for i in range(total_chunks)}
+        stale_ids = [chunk_id for chunk_id in existing if chunk_id not in new_ids]
+        if stale_ids:
+            self._delete_ids(stale_ids)
+        if kept_ids:
+            self._update_stored_metadata(kept_ids, {"total_chunks": total_chunks})
+        return stale_ids
+
+    def _delete_ids(self, ids: List[str]) -> None:
+        self.chroma_collection.delete(ids=ids)
+        self.answer_cache.invalidate_ids(ids)
+        self.stats_store.remove(ids)
+        self._mark_collection_changed()
+
+    def _normalize_query(self, query_text: str) -> str:
+        return " ".join(query_text.split())
+
+    def _result_cache_key(self, query_text: str, n_results: int, filters) -> tuple:
+        return (self._normalize_query(query_text), n_results, repr(filters), self.generation)
+
+    async def _aget_query_embedding(self, query_text: str) -> List[float]:
+        key = self._normalize_query(query_text)
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is None:
+            embedding = await self.embed_limiter.run(
+                lambda: self.embed_model.aget_query_embedding(key),
+                tokens=estimate_tokens(key)
+            )
+            self.query_embedding_cache.set(key, embedding)
+        return embedding
+
+    def _get_query_embedding(self, query_text: str) -> List[float]:
+        key = self._normalize_query(query_text)
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.embed_limiter.run_sync(
+                lambda: self.embed_model.get_query_embedding(key),
+                tokens=estimate_tokens(key)
+            )
+            self.query_embedding_cache.set(key, embedding)
+        return embedding
+
+    def get_query_cache_stats(self) -> Dict:
+        return {
+            "generation": self.generation,
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "query_results": self.query_result_cache.stats(),
+            "answers": self.answer_cache.stats(),
+        }
+
+    def _chunks_fingerprint(self, ids: List[str], texts: List[str]) -> str:
+        return sha256_json([[chunk_id, text] for chunk_id, text in zip(ids, texts)])
+
+    async def _get_cached_answer(self, embedding: List[float], scope: str) -> Optional[Dict]:
+        if self.answer_cache.maxsize <= 0:
+            return None
+        entry = self.answer_cache.lookup(embedding, scope)
+        if entry is None:
+            return None
+        
+        # Only serve the answer if every chunk it was built from is still stored unchanged
+        stored = await asyncio.to_thread(
+            self.chroma_collection.get, ids=entry["ids"], include=["documents"]
+        )
+        current = dict(zip(stored["ids"], stored["documents"]))
+        texts = [current.get(chunk_id) for chunk_id in entry["ids"]]
+        if None in texts or self._chunks_fingerprint(entry["ids"], texts) != entry["fingerprint"]:
+            self.answer_cache.discard(entry["key"])
+            return None
+        
+        logger.info(f"Serving cached answer (similarity {entry['similarity']:.3f})")
+        return entry["value"]
+
+    def _get_retriever(self, n_results: int, filters: Optional[Dict] = None):
+        # Retrievers are cheap to keep and rebuilt only when the index is replaced
+        key = (n_results, repr(filters))
+        retriever = self._retrievers.get(key)
+        if retriever is None:
+            if len(self._retrievers) >= 64:
+                self._retrievers.clear()
+            # filters is a native Chroma where clause (see build_where) so the
+            # vector search itself is restricted instead of over-fetching
             retriever = self.index.as_retriever(
                 similarity_top_k=n_results,
-                filters=filters
+                vector_store_kwargs={"where": filters} if filters else {}
             )
-            nodes = retriever.retrieve(query_text)
+            self._retrievers[key] = retriever
+        return retriever
+
+    async def _aretrieve(self, query_text: str, n_results: int = 3, filters: Optional[Dict] = None) -> List:
+        embedding = await self._aget_query_embedding(query_text)
+        retriever = self._get_retriever(n_results, filters)
+        # With the embedding precomputed only the HNSW search is left, keep it off the event loop
+        return await asyncio.to_thread(
+            retriever.retrieve, QueryBundle(query_str=query_text, embedding=embedding)
+        )
+
+    async def query_async(self, query_text: str, n_results: int = 3, filters: Optional[Dict] = None) -> Dict:
+        try:
+            logger.info(f"Querying: {query_text[:50]}...")
+            
+            cache_key = self._result_cache_key(query_text, n_results, filters)
+            results = self.query_result_cache.get(cache_key)
+            if results is not None:
+                return results
+            
+            nodes = await self._aretrieve(query_text, n_results, filters)
             
             results = {
                 "ids": [[node.node_id for node in nodes]],
@@ -288,23 +903,134 @@ Summary:""")
             }
             
             logger.info(f"Found {len(nodes)} results")
+            self.query_result_cache.set(cache_key, results)
             return results
             
         except Exception as e:
             logger.error(f"Query failed: {e}")
             raise
 
+    def _strip_overlap(self, previous: str, text: str) -> str:
+        # SentenceSplitter repeats up to chunk_overlap tokens of a chunk at the
+        # start of the next one; drop the longest such repeat
+        limit = min(len(previous), len(text), self.chunk_overlap * 10)
+        for size in range(limit, 7, -1):
+            if previous.endswith(text[:size]):
+                return text[size:]
+        return text
+
+    def _merge_neighbor_nodes(self, nodes: List) -> List[Dict]:
+        passages = []
+        seen = set()
+        by_doc = {}
+        for node in nodes:
+            content_hash = node.metadata.get("content_hash") or self._content_hash(node.text)
+            if content_hash in seen:
+                continue
+            seen.add(content_hash)
+            doc_id_prefix = node.metadata.get("doc_id_prefix")
+            chunk_index = node.metadata.get("chunk_index")
+            if doc_id_prefix is None or chunk_index is None:
+                passages.append({"text": node.text, "score": node.score or 0.0, "chunks": 1})
+            else:
+                by_doc.setdefault(doc_id_prefix, []).append((chunk_index, node))
+
+        for doc_nodes in by_doc.values():
+            doc_nodes.sort(key=lambda item: item[0])
+            run = None
+            for chunk_index, node in doc_nodes:
+                if run is not None and chunk_index == run["last_index"] + 1:
+                    tail = self._strip_overlap(run["last_text"], node.text)
+                    run["text"] += tail if tail is not node.text else "\n" + tail
+                    run["score"] = max(run["score"], node.score or 0.0)
+                    run["chunks"] += 1
+                else:
+                    run = {"text": node.text, "score": node.score or 0.0, "chunks": 1}
+                    passages.append(run)
+                run["last_index"] = chunk_index
+                run["last_text"] = node.text
+
+        return passages
+
+    def _build_qa_context(self, nodes: List) -> str:
+        passages = sorted(self._merge_neighbor_nodes(nodes), key=lambda passage: -passage["score"])
+        
+        # Fill the budget by relevance; the most relevant passage is truncated
+        # rather than dropped so the prompt is never empty
+        sections = []
+        used = 0
+        dropped = 0
+        for passage in passages:
+            header = f"Document {len(sections) + 1} (relevance: {passage['score']:.3f}):\n"
+            tokens = estimate_tokens(header + passage["text"])
+            if used + tokens <= self.context_token_budget:
+                sections.append(header + passage["text"])
+                used += tokens
+            elif not sections:
+                sections.append(header + passage["text"][:max(self.context_token_budget * 4 - len(header), 0)])
+                used = estimate_tokens(sections[0])
+            else:
+                dropped += 1
+        context = "\n\n".join(sections)
+        
+        naive_tokens = sum(estimate_tokens(f"Document {i + 1} (relevance: 0.000):\n{node.text}") for i, node in enumerate(nodes))
+        self.context_stats["requests"] += 1
+        self.context_stats["retrieved_chunks"] += len(nodes)
+        self.context_stats["passages"] += len(sections)
+        self.context_stats["dropped_passages"] += dropped
+        self.context_stats["naive_context_tokens"] += naive_tokens
+        self.context_stats["context_tokens"] += estimate_tokens(context)
+        logger.info(
+            f"QA context: {len(nodes)} chunks -> {len(sections)} passages, "
+            f"~{estimate_tokens(context)} tokens (naive ~{naive_tokens}, {dropped} dropped)"
+        )
+        return context
+
+    def get_context_stats(self) -> Dict:
+        stats = dict(self.context_stats, token_budget=self.context_token_budget)
+        naive = stats["naive_context_tokens"]
+        stats["saved_tokens"] = naive - stats["context_tokens"]
+        stats["saved_ratio"] = round(stats["saved_tokens"] / naive, 4) if naive else 0.0
+        return stats
+
+    def _build_qa_chain(self, system_prompt: Optional[str] = None):
+        qa_chain = self._qa_chains.get(system_prompt)
+        if qa_chain is not None:
+            return qa_chain
+        
+        default_system = """You are a helpful mathematical assistant. 
+Answer questions based on the provided context.
+For mathematical expressions, use LaTeX notation with $ or $$ delimiters.
+If the context doesn't contain enough information, say so."""
+        
+        qa_prompt = ChatPromptTemplate.from_messages([
+            ("system", system_prompt or default_system),
+            ("user", "Context:\n{context}\n\nQuestion: {question}\n\nAnswer:")
+        ])
+        
+        if len(self._qa_chains) >= 16:
+            self._qa_chains.clear()
+        qa_chain = qa_prompt | self.llm
+        self._qa_chains[system_prompt] = qa_chain
+        return qa_chain
+
     async def query_with_llm_async(
         self, 
         query_text: str, 
         n_results: int = 3,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        filters: Optional[Dict] = None
     ) -> Dict:
         try:
             logger.info(f"Querying with LLM: {query_text[:50]}...")
             
-            retriever = self.index.as_retriever(similarity_top_k=n_results)
-            nodes = retriever.retrieve(query_text)
+            embedding = await self._aget_query_embedding(query_text)
+            scope = sha256_json([n_results, system_prompt, filters])
+            cached = await self._get_cached_answer(embedding, scope)
+            if cached is not None:
+                return cached
+            
+            nodes = await self._aretrieve(query_text, n_results, filters)
             
             if not nodes:
                 logger.warning("No relevant documents found")
@@ -315,28 +1041,16 @@ Summary:""")
                     "documents": []
                 }
             
-            context = "\n\n".join([
-                f"Document {i+1} (relevance: {node.score:.3f}):\n{node.text}" 
-                for i, node in enumerate(nodes)
-            ])
+            context = self._build_qa_context(nodes)
+            qa_chain = self._build_qa_chain(system_prompt)
             
-            default_system = """You are a helpful mathematical assistant. 
-Answer questions based on the provided context.
-For mathematical expressions, use LaTeX notation with $ or $$ delimiters.
-If the context doesn't contain enough information, say so."""
-            
-            qa_prompt = ChatPromptTemplate.from_messages([
-                ("system", system_prompt or default_system),
-                ("user", "Context:\n{context}\n\nQuestion: {question}\n\nAnswer:")
-            ])
-            
-            qa_chain = qa_prompt | self.llm
-            
-            async with self.semaphore:
-                response = await qa_chain.ainvoke({
+            response = await self.llm_limiter.run(
+                lambda: qa_chain.ainvoke({
                     "context": context,
                     "question": query_text
-                })
+                }),
+                tokens=estimate_tokens(context + query_text) + self.max_tokens
+            )
             
             result = {
                 "answer": response.content,
@@ -346,6 +1060,12 @@ If the context doesn't contain enough information, say so."""
                 "scores": [node.score for node in nodes]
             }
             
+            if self.answer_cache.maxsize > 0:
+                self.answer_cache.store(
+                    embedding, scope, result["ids"],
+                    self._chunks_fingerprint(result["ids"], result["documents"]), result
+                )
+            
             logger.info("Generated answer successfully")
             return result
             
@@ -353,13 +1073,45 @@ If the context doesn't contain enough information, say so."""
             logger.error(f"Query with LLM failed: {e}")
             raise
 
+    async def query_with_llm_stream(
+        self,
+        query_text: str,
+        n_results: int = 3,
+        system_prompt: Optional[str] = None,
+        filters: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        logger.info(f"Streaming LLM answer: {query_text[:50]}...")
+        
+        nodes = await self._aretrieve(query_text, n_results, filters)
+        
+        yield {"type": "sources", "source_nodes": nodes}
+        
+        if not nodes:
+            logger.warning("No relevant documents found")
+            yield {"type": "token", "content": "I couldn't find relevant information to answer your question."}
+            yield {"type": "done"}
+            return
+        
+        context = self._build_qa_context(nodes)
+        qa_chain = self._build_qa_chain(system_prompt)
+        
+        # No retries once tokens are flowing; a failure mid-answer surfaces to the caller
+        async with self.llm_limiter.slot(tokens=estimate_tokens(context + query_text) + self.max_tokens):
+            async with aclosing(qa_chain.astream({"context": context, "question": query_text})) as stream:
+                async for chunk in stream:
+                    if chunk.content:
+                        yield {"type": "token", "content": chunk.content}
+        
+        yield {"type": "done"}
+
     def query_with_llm(
         self, 
         query_text: str, 
         n_results: int = 3,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        filters: Optional[Dict] = None
     ) -> Dict:
-        return asyncio.run(self.query_with_llm_async(query_text, n_results, system_prompt))
+        return asyncio.run(self.query_with_llm_async(query_text, n_results, system_prompt, filters))
     
     def clean_text(self, raw_text: str) -> str:
         if not raw_text:
@@ -370,31 +1122,89 @@ If the context doesn't contain enough information, say so."""
         text = text.strip()
         return text
         
+    def _format_chunk(self, position: int, text: Optional[str], metadata: Optional[Dict]) -> Dict:
+        metadata = metadata or {}
+        chunk = {
+            "id": metadata.get("source", "doc") + f"_chunk_{metadata.get('chunk_index', position)}",
+            "metadata": {
+                "source": metadata.get("source", ""),
+                "author": metadata.get("author", ""),
+                "date": metadata.get("date", ""),
+                "chunk_index": metadata.get("chunk_index", position),
+                "total_chunks": metadata.get("total_chunks", 0)
+            }
+        }
+        if text is not None:
+            chunk["text"] = self.clean_text(text)
+        return chunk
+
+    def get_page(
+        self,
+        offset: int = 0,
+        limit: int = 100,
+        include_text: bool = True,
+        where: Optional[Dict] = None
+    ) -> Dict:
+        page = self.chroma_collection.get(
+            where=where,
+            include=["metadatas", "documents"] if include_text else ["metadatas"],
+            limit=limit,
+            offset=offset
+        )
+        if include_text:
+            documents = [text or "" for text in page["documents"]]
+        else:
+            documents = [None] * len(page["ids"])
+        
+        items = [
+            self._format_chunk(offset + i, text, metadata)
+            for i, (text, metadata) in enumerate(zip(documents, page["metadatas"]))
+        ]
+        return {
+            "items": items,
+            "next_offset": offset + len(items) if len(items) == limit else None
+        }
+
+    def _iter_rows(
+        self,
+        page_size: int = 500,
+        include_text: bool = True,
+        where: Optional[Dict] = None,
+        offset: int = 0
+    ) -> Iterator[tuple]:
+        # Offset pages make Chroma skip every earlier row again on each page,
+        # so a full scan lists the matching ids once (no text or metadata)
+        # and then fetches each page by id: one Chroma page in memory at a
+        # time and linear cost regardless of collection size.
+        # Yields (position, id, text or None, metadata).
+        ids = self.chroma_collection.get(where=where, include=[])["ids"]
+        include = ["metadatas", "documents"] if include_text else ["metadatas"]
+
+        for start in range(offset, len(ids), page_size):
+            batch = ids[start:start + page_size]
+            page = self.chroma_collection.get(ids=batch, include=include)
+            rows = {chunk_id: i for i, chunk_id in enumerate(page["ids"])}
+            for position, chunk_id in enumerate(batch, start):
+                i = rows.get(chunk_id)
+                if i is None:
+                    # Deleted since the ids were listed
+                    continue
+                text = (page["documents"][i] or "") if include_text else None
+                yield position, chunk_id, text, page["metadatas"][i]
+
+    def iter_all(
+        self,
+        page_size: int = 500,
+        include_text: bool = True,
+        where: Optional[Dict] = None,
+        offset: int = 0
+    ) -> Iterator[Dict]:
+        for position, _, text, chunk_metadata in self._iter_rows(page_size, include_text, where, offset):
+            yield self._format_chunk(position, text, chunk_metadata)
+
     def get_all(self) -> List[Dict]:
         try:
-            raw_chunks = self.chroma_collection.get()
-            processed_chunks = []
-
-            documents = raw_chunks.get("documents", [])
-            metadatas = raw_chunks.get("metadatas", [])
-            ids = raw_chunks.get("ids", [])
-
-            for i, (doc_id, text, metadata) in enumerate(zip(ids, documents, metadatas)):
-                chunk_id = metadata.get("source", "doc") + f"_chunk_{metadata.get('chunk_index', i)}"
-
-                processed_chunks.append({
-                    "id": chunk_id,
-                    "text": self.clean_text(text) if text else "",
-                    "metadata": {
-                        "source": metadata.get("source", ""),
-                        "author": metadata.get("author", ""),
-                        "date": metadata.get("date", ""),
-                        "chunk_index": metadata.get("chunk_index", i),
-                        "total_chunks": metadata.get("total_chunks", 0)
-                    }
-                })
-
-            return processed_chunks
+            return list(self.iter_all())
 
         except Exception as e:
             logger.error(f"Failed to get all documents: {e}")
@@ -403,30 +1213,44 @@ If the context doesn't contain enough information, say so."""
     def delete(self, doc_id: str) -> None:
         try:
             logger.info(f"Deleting document: {doc_id}")
+            # Same where clause the vector store deletes by, read first so the stats stay exact
+            deleted_ids = self.chroma_collection.get(where={"document_id": doc_id}, include=[])["ids"]
             self.index.delete_ref_doc(doc_id, delete_from_docstore=True)
+            self.answer_cache.invalidate_ids(deleted_ids)
+            self.stats_store.remove(deleted_ids)
+            self._mark_collection_changed()
             logger.info(f"Successfully deleted: {doc_id}")
         except Exception as e:
             logger.error(f"Failed to delete document: {e}")
             raise
 
-    def delete_by_prefix(self, prefix: str) -> int:
+    def delete_document(self, doc_id_prefix: str, batch_size: int = 1000) -> int:
+        # Only the matching chunks are touched: ids come from a where lookup a
+        # batch at a time, so a huge document never has to fit in one request
         try:
-            logger.info(f"Deleting documents with prefix: {prefix}")
-            all_docs = self.get_all()
+            logger.info(f"Deleting document: {doc_id_prefix}")
+            where = {"doc_id_prefix": doc_id_prefix}
             
             deleted_count = 0
-            for doc_id in all_docs["ids"]:
-                if doc_id.startswith(prefix):
-                    self.delete(doc_id)
-                    deleted_count += 1
+            while True:
+                batch = self.chroma_collection.get(where=where, include=[], limit=batch_size)
+                if not batch["ids"]:
+                    break
+                self._delete_ids(batch["ids"])
+                deleted_count += len(batch["ids"])
             
-            logger.info(f"Deleted {deleted_count} documents")
+            logger.info(f"Deleted {deleted_count} chunks of {doc_id_prefix}")
             return deleted_count
             
         except Exception as e:
-            logger.error(f"Failed to delete by prefix: {e}")
+            logger.error(f"Failed to delete document: {e}")
             raise
 
+    def delete_by_prefix(self, prefix: str) -> int:
+        # Chunk ids are "<doc_id_prefix>_chunk_<n>"; Chroma cannot match ids by
+        # prefix, so match on the doc_id_prefix metadata instead
+        return self.delete_document(prefix)
+
     def clear(self) -> None:
         try:
             logger.warning(f"Clearing collection: {self.collection_name}")
@@ -442,6 +1266,10 @@ If the context doesn't contain enough information, say so."""
                 self.vector_store,
                 storage_context=self.storage_context
             )
+            self._retrievers.clear()
+            self.answer_cache.clear()
+            self.stats_store.clear()
+            self._mark_collection_changed()
             
             logger.info("Collection cleared successfully")
             
@@ -449,6 +1277,48 @@ If the context doesn't contain enough information, say so."""
             logger.error(f"Failed to clear collection: {e}")
             raise
 
+    def list_ids(self, where: Optional[Dict] = None) -> List[str]:
+        # Sorted, so a run over the collection can resume after the last id it
+        # finished instead of at an offset that shifts with every insert/delete
+        return sorted(self.chroma_collection.get(where=where, include=[])["ids"])
+
+    async def rewrite_metadata_page_async(
+        self,
+        ids: List[str],
+        filter_fn: Optional[Callable[[str, Dict], bool]] = None
+    ) -> Dict:
+        # Reads one page of chunks by id straight from Chroma and writes the
+        # new summaries back with a single multi-id update
+        page = await asyncio.to_thread(
+            self.chroma_collection.get,
+            ids=ids,
+            include=["documents", "metadatas"]
+        )
+        
+        selected = [
+            (chunk_id, text or "", chunk_metadata or {})
+            for chunk_id, text, chunk_metadata in zip(page["ids"], page["documents"], page["metadatas"])
+            if filter_fn is None or filter_fn(chunk_id, chunk_metadata or {})
+        ]
+        
+        updated = 0
+        if selected:
+            summaries = await self._generate_summaries_async([text for _, text, _ in selected])
+            ids = [chunk_id for chunk_id, _, _ in selected]
+            metadatas = [
+                self._patch_metadata(chunk_metadata, {"summary": summary, "has_math": self._is_math_block(text)})
+                for (_, text, chunk_metadata), summary in zip(selected, summaries)
+            ]
+            await asyncio.to_thread(self.chroma_collection.update, ids=ids, metadatas=metadatas)
+            self.stats_store.upsert([
+                self._stats_row(chunk_id, text, chunk_metadata)
+                for chunk_id, (_, text, chunk_metadata) in zip(ids, selected)
+            ])
+            self._mark_collection_changed()
+            updated = len(ids)
+        
+        return {"read": len(page["ids"]), "updated": updated}
+
     async def rewrite_chunk_metadatas_async(
         self,
         limit: Optional[int] = None,
@@ -460,54 +1330,14 @@ If the context doesn't contain enough information, say so."""
         try:
             logger.info("Starting async metadata rewrite")
             
-            all_nodes = list(self.index.docstore.docs.values())
-            
-            if filter_fn:
-                all_nodes = [
-                    node for node in all_nodes 
-                    if filter_fn(node.node_id, node.metadata)
-                ]
-            
-            if limit:
-                selected_nodes = all_nodes[start_index:start_index + limit]
-            else:
-                selected_nodes = all_nodes[start_index:]
-            
-            logger.info(f"Processing {len(selected_nodes)} documents in batches of {batch_size}")
-            
+            ids = await asyncio.to_thread(self.list_ids)
+            ids = ids[start_index:start_index + limit if limit else None]
             updated_count = 0
             
-            for batch_start in range(0, len(selected_nodes), batch_size):
-                batch = selected_nodes[batch_start:batch_start + batch_size]
-                
-                tasks = [
-                    self._generate_summary_async(node.text, [])
-                    for node in batch
-                ]
-                
-                summaries = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                for node, summary in zip(batch, summaries):
-                    try:
-                        if isinstance(summary, Exception):
-                            logger.error(f"Failed to generate summary for {node.node_id}: {summary}")
-                            continue
-                        
-                        node.metadata["summary"] = summary
-                        node.metadata["has_math"] = self._is_math_block(node.text)
-                        
-                        self.chroma_collection.update(
-                            ids=[node.node_id],
-                            metadatas=[node.metadata]
-                        )
-                        
-                        updated_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to update node {node.node_id}: {e}")
-                        continue
-                
-                logger.info(f"Processed batch: {updated_count}/{len(selected_nodes)} documents updated")
+            for start in range(0, len(ids), batch_size):
+                result = await self.rewrite_metadata_page_async(ids[start:start + batch_size], filter_fn)
+                updated_count += result["updated"]
+                logger.info(f"Processed batch: {updated_count} documents updated, {start + result['read']}/{len(ids)} read")
             
             logger.info(f"Successfully updated {updated_count} documents")
             return updated_count
@@ -526,30 +1356,36 @@ If the context doesn't contain enough information, say so."""
             self.rewrite_chunk_metadatas_async(limit, start_index, filter_fn)
         )
 
+    def rebuild_stats(self, page_size: int = 1000) -> Dict:
+        # Recovery path: recount everything from a full scan of the collection
+        logger.info(f"Rebuilding stats for collection: {self.collection_name}")
+        self.stats_store.clear(initialized=False)
+        rows = []
+        for _, chunk_id, text, chunk_metadata in self._iter_rows(page_size):
+            rows.append(self._stats_row(chunk_id, text, chunk_metadata))
+            if len(rows) >= page_size:
+                self.stats_store.upsert(rows)
+                rows = []
+        self.stats_store.upsert(rows)
+        self.stats_store.mark_initialized()
+        return self.get_stats()
+
     def get_stats(self) -> Dict:
         try:
-            all_docs = self.get_all()
-            
-            total_docs = len(all_docs["ids"])
-            math_docs = sum(
-                1 for metadata in all_docs.get("metadatas", [])
-                if metadata and metadata.get("has_math", False)
-            )
-            
-            prefixes = {}
-            for metadata in all_docs.get("metadatas", []):
-                if metadata:
-                    prefix = metadata.get("doc_id_prefix", "unknown")
-                    prefixes[prefix] = prefixes.get(prefix, 0) + 1
+            snapshot = self.stats_store.snapshot()
             
             stats = {
-                "total_documents": total_docs,
-                "documents_with_math": math_docs,
-                "documents_by_prefix": prefixes,
+                "total_documents": snapshot["total_chunks"],
+                "documents_with_math": snapshot["math_chunks"],
+                "documents_by_prefix": {
+                    prefix: document["chunks"] for prefix, document in snapshot["documents"].items()
+                },
+                "total_text_bytes": snapshot["total_text_bytes"],
+                "documents": snapshot["documents"],
                 "collection_name": self.collection_name
             }
             
-            logger.info(f"Stats: {stats}")
+            logger.info(f"Stats: {stats['total_documents']} chunks in {len(stats['documents'])} documents")
             return stats
             
         except Exception as e:
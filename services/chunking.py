@@ -0,0 +1,70 @@
+import re
+from typing import List
+
+# Display math first so "$$...$$" is never split into two inline spans
+MATH_SPAN_PATTERN = re.compile(r'\$\$[\s\S]*?\$\$|\$[^\$]+?\$')
+# Only canonical indices, so text that merely looks like a placeholder
+# ("__MATH_BLOCK_01__") is left alone exactly as before
+PLACEHOLDER_PATTERN = re.compile(r'__MATH_BLOCK_(0|[1-9][0-9]*)__')
+# Union of the inline/display math, LaTeX command and math symbol checks
+MATH_BLOCK_PATTERN = re.compile(
+    r'\$\$.*?\$\$|\$.*?\$|\\[a-zA-Z]+|\\frac|\\int|\\sum|[∑∫∂∇√≠≤≥∈⊂∞]'
+)
+
+
+def is_math_block(text: str) -> bool:
+    return MATH_BLOCK_PATTERN.search(text) is not None
+
+
+# Splits text with a llama-index splitter without ever cutting through a
+# $...$ or $$...$$ span: spans are swapped for placeholders before splitting
+# and restored afterwards in one regex pass per chunk.
+#
+# The one intended difference from the old per-index str.replace loop: a
+# restored span is never scanned again, so a formula whose own text looks
+# like a later placeholder ("$__MATH_BLOCK_1__$") comes back verbatim
+# instead of having the later formula spliced into it.
+class MathAwareChunker:
+    def __init__(self, splitter):
+        self.splitter = splitter
+
+    def split(self, text: str) -> List[str]:
+        math_blocks = []
+
+        def protect(match):
+            math_blocks.append(match.group(0))
+            return f"__MATH_BLOCK_{len(math_blocks) - 1}__"
+
+        def restore(match):
+            idx = int(match.group(1))
+            return math_blocks[idx] if idx < len(math_blocks) else match.group(0)
+
+        protected_text = MATH_SPAN_PATTERN.sub(protect, text)
+        chunks = self.splitter.split_text(protected_text)
+        if not math_blocks:
+            return chunks
+        return [PLACEHOLDER_PATTERN.sub(restore, chunk) for chunk in chunks]
+
+    def stream(self) -> "StreamingChunker":
+        return StreamingChunker(self)
+
+
+# Page-by-page variant: every chunk but the last is final once a page is fed;
+# the last one may continue on the next page, so it is carried over and
+# re-split together with it.
+class StreamingChunker:
+    def __init__(self, chunker: MathAwareChunker):
+        self.chunker = chunker
+        self.buffer = ""
+
+    def feed(self, page_text: str) -> List[str]:
+        self.buffer = f"{self.buffer}\n\n{page_text}" if self.buffer else page_text
+        chunks = self.chunker.split(self.buffer)
+        self.buffer = chunks[-1] if chunks else ""
+        return chunks[:-1]
+
+    def finish(self) -> List[str]:
+        buffer, self.buffer = self.buffer, ""
+        if not buffer.strip():
+            return []
+        return self.chunker.split(buffer)
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+
+from config import (
+    INGEST_WORKERS, OCR_WORKERS, INGEST_SPOOL_DIR, INGEST_JOBS_PATH, PARSE_CACHE_ENABLED, PIPELINE_QUEUE_SIZE
+)
+from services.pipeline import IngestionPipeline
+
+logger = logging.getLogger(__name__)
+
+JOB_FIELDS = (
+    "id", "filename", "path", "status", "pages_done", "pages_total",
+    "chunks_total", "chunks_inserted", "failures", "error", "text_layer",
+    "cancel_requested", "created_at", "updated_at",
+)
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+# Job state shared between the API process and the parse workers
+class JobStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                pages_total INTEGER,
+                chunks_total INTEGER,
+                chunks_inserted INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                text_layer TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def create(self, job_id: str, filename: str, path: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, filename, path, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, filename, path, now, now)
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields) -> None:
+        if "text_layer" in fields and fields["text_layer"] is not None:
+            fields["text_layer"] = json.dumps(fields["text_layer"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def increment(self, job_id: str, field: str, amount: int = 1) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {field} = {field} + ?, updated_at = ? WHERE id = ?",
+                (amount, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def _row_to_job(self, row) -> Dict:
+        job = dict(zip(JOB_FIELDS, row))
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["text_layer"] = json.loads(job["text_layer"]) if job["text_layer"] else None
+        job.pop("path")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def request_cancel(self, job_id: str) -> None:
+        self.update(job_id, cancel_requested=1)
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def fail_unfinished(self, reason: str) -> List[str]:
+        # Returns the spool paths of the jobs it failed, for cleanup
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        with self._lock:
+            paths = [row[0] for row in self._conn.execute(
+                f"SELECT path FROM jobs WHERE status NOT IN ({placeholders})", FINISHED_STATUSES
+            )]
+            self._conn.execute(
+                f"UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE status NOT IN ({placeholders})",
+                (reason, time.time(), *FINISHED_STATUSES)
+            )
+            self._conn.commit()
+        return paths
+
+
+def _put_page(page_queue, item, store: JobStore, job_id: str) -> bool:
+    # Blocks while the pipeline is behind, but gives up once the job is cancelled
+    while True:
+        try:
+            page_queue.put(item, timeout=1)
+            return True
+        except queue.Full:
+            if store.is_cancel_requested(job_id):
+                return False
+
+
+def parse_job(job_id: str, path: str, store_path: str, page_queue, ocr_workers: int = OCR_WORKERS) -> Optional[Dict]:
+    # Runs in a worker process, so the heavy parser imports stay out of the API process
+    from pdf2image import pdfinfo_from_path
+    from services.cache import get_parse_cache
+    from services.ocr import get_ocr_executor
+    from services.parser import iter_parse_pdf, summarize_triage
+
+    store = JobStore(store_path)
+    store.update(job_id, status="running", pages_total=pdfinfo_from_path(path)["Pages"])
+
+    report = []
+    pages_done = 0
+    cache = get_parse_cache() if PARSE_CACHE_ENABLED else None
+    try:
+        executor = get_ocr_executor(workers=ocr_workers)
+        for _, page_text in iter_parse_pdf(path, report=report, cache=cache, executor=executor):
+            if not _put_page(page_queue, page_text, store, job_id):
+                return None
+            pages_done += 1
+            store.update(job_id, pages_done=pages_done)
+            if store.is_cancel_requested(job_id):
+                return None
+    finally:
+        _put_page(page_queue, None, store, job_id)
+
+    return summarize_triage(report)
+
+
+class IngestionJobManager:
+    def __init__(
+        self,
+        client,
+        store_path: str = INGEST_JOBS_PATH,
+        spool_dir: str = INGEST_SPOOL_DIR,
+        workers: int = INGEST_WORKERS,
+    ):
+        self.client = client
+        self.store = JobStore(store_path)
+        self.spool_dir = spool_dir
+        self.workers = workers
+        # Every ingest worker starts its own OCR pool; split the OCR budget
+        # between them instead of oversubscribing the CPUs workers-fold
+        self.ocr_workers = max(1, OCR_WORKERS // workers)
+        self.pipeline = IngestionPipeline(client)
+        self._executor = None
+        self._manager = None
+        self._tasks = {}
+
+        os.makedirs(spool_dir, exist_ok=True)
+        interrupted = self.store.fail_unfinished("Interrupted by server restart")
+        if interrupted:
+            logger.warning(f"Marked {len(interrupted)} unfinished ingestion jobs as failed")
+        for path in interrupted:
+            # Nothing will resume these jobs, so their spooled uploads can go
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _get_manager(self):
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager
+
+    def _spool(self, job_id: str, fileobj) -> str:
+        path = os.path.join(self.spool_dir, f"{job_id}.pdf")
+        with open(path, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        return path
+
+    async def submit(self, filename: str, fileobj) -> str:
+        job_id = uuid.uuid4().hex
+        path = await asyncio.to_thread(self._spool, job_id, fileobj)
+        self.store.create(job_id, filename, path)
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id, filename, path))
+        logger.info(f"Queued ingestion job {job_id} for {filename}")
+        return job_id
+
+    async def _iter_pages(self, page_queue, future) -> AsyncIterator[str]:
+        while True:
+            try:
+                page_text = await asyncio.to_thread(page_queue.get, True, 1)
+            except queue.Empty:
+                if future.done():
+                    # The worker died without sending the end marker
+                    future.result()
+                    return
+                continue
+
+            if page_text is None:
+                # The end marker is sent even when parsing fails; surface the
+                # worker's error here so the pipeline rolls back instead of
+                # treating a partial document as complete
+                await asyncio.wrap_future(future)
+                return
+            yield page_text
+
+    async def _run(self, job_id: str, filename: str, path: str) -> None:
+        future = None
+        try:
+            page_queue = self._get_manager().Queue(maxsize=PIPELINE_QUEUE_SIZE)
+            future = self._get_executor().submit(
+                parse_job, job_id, path, self.store.path, page_queue, self.ocr_workers
+            )
+
+            metadata = {"source": filename}
+            total_chunks = await self.pipeline.run(
+                doc_id_prefix=filename,
+                pages=self._iter_pages(page_queue, future),
+                metadata=metadata,
+                on_inserted=lambda count: self.store.increment(job_id, "chunks_inserted", count)
+            )
+            text_layer = await asyncio.wrap_future(future)
+
+            if text_layer is None:
+                self.store.update(job_id, status="cancelled")
+                return
+
+            if not total_chunks:
+                self.store.update(job_id, status="failed", error="PDF без текста", text_layer=text_layer)
+                return
+
+            self.store.update(job_id, status="done", chunks_total=total_chunks, text_layer=text_layer)
+            logger.info(f"Ingestion job {job_id} finished: {total_chunks} chunks")
+
+        except asyncio.CancelledError:
+            self.store.update(job_id, status="cancelled")
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            self.store.increment(job_id, "failures")
+            self.store.update(job_id, status="failed", error=str(e))
+        finally:
+            if future is not None and not future.done():
+                # cancel() is a no-op once the worker is running; the flag is
+                # what makes it stop waiting on a queue nobody reads anymore
+                self.store.request_cancel(job_id)
+                future.cancel()
+            self._tasks.pop(job_id, None)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+
+        # The worker stops at the next page boundary; cancelling the task
+        # tears down the pipeline and removes anything already inserted
+        self.store.request_cancel(job_id)
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        self.store.update(job_id, status="cancelled")
+
+        return self.store.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        return self.store.list(limit)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
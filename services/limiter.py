@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    if isinstance(error, openai.RateLimitError):
+        return "throttled"
+    if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+        return "server_error"
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return "server_error"
+    return None
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# Gate for every OpenAI call: requests/min and tokens/min token buckets,
+# exponential backoff with full jitter on 429/5xx, and an AIMD concurrency
+# limit that grows by one per window of successes and halves on throttling.
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        initial_concurrency: int = 10,
+        min_concurrency: int = 1,
+        max_concurrency: int = 64,
+        max_retries: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        throttle_cooldown: float = 2.0,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_cooldown = throttle_cooldown
+        self._last_cut = float("-inf")
+
+        self._bucket_lock = threading.Lock()
+        self._condition = None
+        self.in_flight = 0
+        self.counters = {"calls": 0, "successes": 0, "throttled": 0, "server_errors": 0, "retries": 0, "failures": 0}
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _reserve(self, tokens: int) -> float:
+        with self._bucket_lock:
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+            if wait == 0:
+                self.requests.consume(1)
+                self.tokens.consume(tokens)
+            return wait
+
+    def _on_success(self) -> None:
+        self.counters["successes"] += 1
+        self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+
+    def _on_throttled(self) -> None:
+        self.counters["throttled"] += 1
+        # A burst of 429s from calls that were in flight together is one
+        # signal, not one per call; cut once per cooldown window
+        now = time.monotonic()
+        if now - self._last_cut >= self.throttle_cooldown:
+            self._last_cut = now
+            self.limit = max(self.min_concurrency, self.limit / 2)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    async def _acquire(self, tokens: int) -> None:
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+        # The slot is already taken; give it back if the caller is cancelled
+        # while waiting on the buckets, the caller's finally never runs
+        try:
+            while True:
+                wait = self._reserve(tokens)
+                if wait == 0:
+                    return
+                await asyncio.sleep(wait)
+        except BaseException:
+            await self._release()
+            raise
+
+    async def _release(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def _record_failure(self, error: Exception, attempt: int) -> Optional[float]:
+        kind = classify_error(error)
+        if kind == "throttled":
+            self._on_throttled()
+        elif kind == "server_error":
+            self.counters["server_errors"] += 1
+
+        if kind is None or attempt >= self.max_retries:
+            self.counters["failures"] += 1
+            return None
+
+        self.counters["retries"] += 1
+        delay = self._backoff(attempt, error)
+        logger.warning(f"{self.name}: {kind} ({error.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        self.counters["calls"] += 1
+        attempt = 0
+        while True:
+            await self._acquire(tokens)
+            try:
+                result = await call()
+            except Exception as e:
+                delay = self._record_failure(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._on_success()
+                return result
+            finally:
+                await self._release()
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        # A single attempt holding one concurrency slot, for calls that cannot
+        # be replayed once they have started (streamed responses)
+        self.counters["calls"] += 1
+        await self._acquire(tokens)
+        try:
+            yield
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == "throttled":
+                self._on_throttled()
+            elif kind == "server_error":
+                self.counters["server_errors"] += 1
+            self.counters["failures"] += 1
+            raise
+        else:
+            self._on_success()
+        finally:
+            await self._release()
+
+    def run_sync(self, call: Callable[[], T], tokens: int = 0) -> T:
+        # Blocking callers only go through the buckets and backoff, the
+        # concurrency gate lives on the event loop
+        self.counters["calls"] += 1
+        attempt = 0
+        while True:
+            wait = self._reserve(tokens)
+            while wait:
+                time.sleep(wait)
+                wait = self._reserve(tokens)
+            try:
+                result = call()
+            except Exception as e:
+                delay = self._record_failure(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self._on_success()
+                return result
+
+    def stats(self) -> Dict:
+        with self._bucket_lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "name": self.name,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level, 1),
+                **self.counters,
+            }
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
@@ -0,0 +1,123 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import pytesseract
+from PIL import Image
+
+from config import OCR_WORKERS, OCR_BACKEND
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+FORMULA_INDICATORS = ['=', '∑', '∫', '∂', '√', '^', '_', '\\frac', '{', '}']
+
+
+class PytesseractEngine:
+    name = "pytesseract"
+
+    def image_to_string(self, image, lang="eng", psm=None):
+        config = f"--psm {psm}" if psm is not None else ""
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    name = "tesserocr"
+
+    def __init__(self):
+        # One API handle per language; language data is loaded once per process
+        self._apis = {}
+
+    def _get_api(self, lang):
+        api = self._apis.get(lang)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=lang)
+            self._apis[lang] = api
+        return api
+
+    def image_to_string(self, image, lang="eng", psm=None):
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+        api = self._get_api(lang)
+        api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+        api.SetImage(Image.fromarray(image))
+        try:
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+    def close(self):
+        for api in self._apis.values():
+            api.End()
+        self._apis.clear()
+
+
+OCR_ENGINES = {
+    "pytesseract": PytesseractEngine,
+    "tesserocr": TesserocrEngine,
+}
+
+_engine = None
+_executor = None
+
+def create_ocr_engine(backend=OCR_BACKEND):
+    if backend == "tesserocr" and tesserocr is None:
+        print("tesserocr is not installed, falling back to pytesseract")
+        backend = "pytesseract"
+    return OCR_ENGINES[backend]()
+
+def init_ocr_engine(backend=OCR_BACKEND):
+    global _engine
+    if _engine is not None:
+        _engine.close()
+    _engine = create_ocr_engine(backend)
+
+def get_ocr_engine():
+    if _engine is None:
+        init_ocr_engine()
+    return _engine
+
+def get_ocr_executor(workers=OCR_WORKERS, backend=OCR_BACKEND):
+    global _executor
+    if _executor is None:
+        # spawn keeps workers from inheriting the parent's torch/YOLO state
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_ocr_engine,
+            initargs=(backend,)
+        )
+    return _executor
+
+def shutdown_ocr_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+def ocr_text(crop):
+    return get_ocr_engine().image_to_string(crop, lang="eng")
+
+def is_likely_formula_region(crop_image):
+    try:
+        gray = cv2.cvtColor(crop_image, cv2.COLOR_BGR2GRAY)
+        
+        text = get_ocr_engine().image_to_string(gray, psm=6)
+        
+        indicator_count = sum(1 for char in text if char in FORMULA_INDICATORS)
+        
+        return indicator_count >= 2
+    except Exception as e:
+        print(f"Formula detection error: {e}")
+        return False
+
+def probe_unknown_block(crop):
+    if is_likely_formula_region(crop):
+        return True, None
+    return False, ocr_text(crop)
@@ -1,30 +1,29 @@
 import cv2
 import numpy as np
-from pdf2image import convert_from_path
-import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pdfplumber
-import requests
 import torch
 from ultralytics import YOLO
 
-def latex_ocr_remote(image):
-    _, png = cv2.imencode(".png", image)
-    resp = requests.post(
-        "http://localhost:8502/predict",
-        files={"file": ("image.png", png.tobytes(), "image/png")}
-    )
-    print("CALLING PIX2TEX NOW!")
+from config import (
+    PDF_RENDER_DPI, PDF_PAGE_WINDOW, YOLO_BATCH_SIZE, YOLO_IMGSZ,
+    TEXT_LAYER_MODE, TEXT_LAYER_MIN_CHARS, OCR_BACKEND,
+    PARSE_CACHE_ENABLED, YOLO_MODEL_FILE
+)
+from services.cache import get_parse_cache, sha256_file
+from services.pix2tex import get_formula_client
+from services.ocr import get_ocr_executor, ocr_text, probe_unknown_block, is_likely_formula_region
 
-    return resp.text.strip()
+def latex_ocr_remote(image):
+    return get_formula_client().recognize(image)
 
-model_file = "yolov8s-doclaynet.pt"
+model_file = YOLO_MODEL_FILE
 yolo_model = YOLO(model_file)
 
-def detect_layout(image, confidence_threshold=0.5):
-    results = yolo_model(image)
+def _result_to_blocks(result, confidence_threshold=0.5):
     blocks = []
     
-    for det in results[0].boxes.data.tolist():
+    for det in result.boxes.data.tolist():
         x1, y1, x2, y2, score, class_id = det
         
         if score < confidence_threshold:
@@ -42,19 +41,19 @@ def detect_layout(image, confidence_threshold=0.5):
     blocks.sort(key=lambda x: x["y1"])
     return blocks
 
-def is_likely_formula_region(crop_image):
-    try:
-        gray = cv2.cvtColor(crop_image, cv2.COLOR_BGR2GRAY)
-        
-        text = pytesseract.image_to_string(gray, config='--psm 6')
-        
-        formula_indicators = ['=', '∑', '∫', '∂', '√', '^', '_', '\\frac', '{', '}']
-        indicator_count = sum(1 for char in text if char in formula_indicators)
-        
-        return indicator_count >= 2
-    except Exception as e:
-        print(f"Formula detection error: {e}")
-        return False
+def detect_layout(image, confidence_threshold=0.5):
+    results = yolo_model(image)
+    return _result_to_blocks(results[0], confidence_threshold)
+
+def detect_layout_batch(images, confidence_threshold=0.5, batch_size=YOLO_BATCH_SIZE, imgsz=YOLO_IMGSZ):
+    pages_blocks = []
+
+    for start in range(0, len(images), batch_size):
+        batch = list(images[start:start + batch_size])
+        results = yolo_model(batch, batch=len(batch), imgsz=imgsz, verbose=False)
+        pages_blocks.extend(_result_to_blocks(result, confidence_threshold) for result in results)
+
+    return pages_blocks
 
 def visualize_detection(image, blocks, output_path="debug_detection.png"):
     vis_image = image.copy()
@@ -78,46 +77,249 @@ def visualize_detection(image, blocks, output_path="debug_detection.png"):
     cv2.imwrite(output_path, vis_image)
     print(f"Debug visualization saved to {output_path}")
 
-def parse_pdf(path, confidence_threshold=0.5, debug=False):
-    page_images = convert_from_path(path)
-    results = []
+FORMULA_LABELS = ("formula", "formulas", "math", "equation")
 
-    with pdfplumber.open(path):
-        for page_num, pil_img in enumerate(page_images):
-            print(f"Processing page {page_num + 1}")
-            
-            cv_img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-            layout_blocks = detect_layout(cv_img, confidence_threshold)
-            
-            if debug:
-                visualize_detection(cv_img, layout_blocks, f"page_{page_num+1}_detection.png")
-
-            page_text = []
-            for i, block in enumerate(layout_blocks):
-                x1, y1, x2, y2 = block["x1"], block["y1"], block["x2"], block["y2"]
-                crop = cv_img[y1:y2, x1:x2]
-                
-                print(f"Block {i+1}: {block['label']} (score: {block.get('score', 0):.2f})")
-
-                if block["label"] in ("text", "title"):
-                    text = pytesseract.image_to_string(crop, lang="eng")
-                    page_text.append(text)
-                elif block["label"] == "table":
-                    table_text = pytesseract.image_to_string(crop, lang="eng")
-                    page_text.append("\nTABLE:\n" + table_text)
-                elif (block["label"].lower() in ("formula", "formulas", "math", "equation") or 
-                      is_likely_formula_region(crop)):
-                    try:
-                        latex = latex_ocr_remote(crop)
-                        page_text.append(f"\n$$\n{latex}\n$$\n")
-                    except Exception as e:
-                        print(f"LaTeX OCR failed: {e}")
-                        fallback = pytesseract.image_to_string(crop, lang="eng")
-                        page_text.append(f"FORMULA FALLBACK: {fallback}")
+def _formula_text(executor, crop, latex_future=None, fallbacks=None):
+    try:
+        latex = (latex_future or get_formula_client().submit(crop)).result()
+        return f"\n$$\n{latex}\n$$\n"
+    except Exception as e:
+        print(f"LaTeX OCR failed: {e}")
+        if fallbacks is not None:
+            fallbacks.append("formula")
+        fallback = executor.submit(ocr_text, crop).result()
+        return f"FORMULA FALLBACK: {fallback}"
+
+def has_usable_text_layer(text, min_chars=TEXT_LAYER_MIN_CHARS):
+    if not text:
+        return False
+
+    stripped = "".join(text.split())
+    if len(stripped) < min_chars:
+        return False
+
+    # Fonts without a ToUnicode map come out as "(cid:NN)" or U+FFFD
+    garbage = text.count("(cid:") * 6 + text.count("\ufffd")
+    if garbage > 0.05 * len(stripped):
+        return False
+
+    alnum_ratio = sum(1 for ch in stripped if ch.isalnum()) / len(stripped)
+    return alnum_ratio >= 0.5
+
+def triage_page(plumber_page, mode=TEXT_LAYER_MODE):
+    if mode == "off":
+        return "ocr", None
+
+    text = plumber_page.extract_text() or ""
+    if not has_usable_text_layer(text):
+        return "ocr", None
+
+    return ("native", text) if mode == "direct" else ("hybrid", None)
+
+def _native_block_text(plumber_page, block, scale):
+    x0, top, x1, bottom = plumber_page.bbox
+    bbox = (
+        max(x0 + block["x1"] / scale, x0),
+        max(top + block["y1"] / scale, top),
+        min(x0 + block["x2"] / scale, x1),
+        min(top + block["y2"] / scale, bottom),
+    )
+    if bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        return ""
+    return plumber_page.crop(bbox).extract_text() or ""
+
+def submit_page(executor, cv_img, page_num, layout_blocks, debug=False, plumber_page=None, dpi=PDF_RENDER_DPI):
+    if debug:
+        visualize_detection(cv_img, layout_blocks, f"page_{page_num+1}_detection.png")
+
+    pending = []
+    for i, block in enumerate(layout_blocks):
+        x1, y1, x2, y2 = block["x1"], block["y1"], block["x2"], block["y2"]
+        crop = cv_img[y1:y2, x1:x2]
+
+        print(f"Block {i+1}: {block['label']} (score: {block.get('score', 0):.2f})")
+
+        # Text drawn inside an embedded image has no text layer; OCR those blocks
+        native = ""
+        if block["label"] in ("text", "title", "table") and plumber_page is not None:
+            native = _native_block_text(plumber_page, block, dpi / 72)
+
+        if native.strip() and block["label"] == "table":
+            pending.append(("native", "\nTABLE:\n" + native, crop))
+        elif native.strip():
+            pending.append(("native", native, crop))
+        elif block["label"] in ("text", "title"):
+            pending.append(("text", executor.submit(ocr_text, crop), crop))
+        elif block["label"] == "table":
+            pending.append(("table", executor.submit(ocr_text, crop), crop))
+        elif block["label"].lower() in FORMULA_LABELS:
+            pending.append(("formula", get_formula_client().submit(crop), crop))
+        else:
+            pending.append(("unknown", executor.submit(probe_unknown_block, crop), crop))
+
+    return pending
+
+def collect_page(executor, pending, fallbacks=None):
+    page_text = []
+    for kind, result, crop in pending:
+        if kind == "native":
+            page_text.append(result)
+        elif kind == "text":
+            page_text.append(result.result())
+        elif kind == "table":
+            page_text.append("\nTABLE:\n" + result.result())
+        elif kind == "formula":
+            page_text.append(_formula_text(executor, crop, result, fallbacks))
+        else:
+            is_formula, fallback = result.result()
+            if is_formula:
+                page_text.append(_formula_text(executor, crop, fallbacks=fallbacks))
+            else:
+                page_text.append(f"UNKNOWN BLOCK: {fallback}")
+
+    return "\n".join(page_text)
+
+def iter_page_windows(path, dpi=PDF_RENDER_DPI, window=PDF_PAGE_WINDOW):
+    page_count = pdfinfo_from_path(path)["Pages"]
+
+    for first_page in range(1, page_count + 1, window):
+        last_page = min(first_page + window - 1, page_count)
+        yield first_page - 1, convert_from_path(path, dpi=dpi, first_page=first_page, last_page=last_page)
+
+def render_pages(path, page_nums, dpi=PDF_RENDER_DPI):
+    cv_images = {}
+
+    # Render contiguous runs with one pdftoppm call each
+    runs = []
+    for page_num in sorted(page_nums):
+        if runs and runs[-1][1] == page_num - 1:
+            runs[-1][1] = page_num
+        else:
+            runs.append([page_num, page_num])
+
+    for first, last in runs:
+        pil_images = convert_from_path(path, dpi=dpi, first_page=first + 1, last_page=last + 1)
+        for offset, pil_img in enumerate(pil_images):
+            cv_images[first + offset] = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+            pil_img.close()
+        del pil_images
+
+    return cv_images
+
+def iter_parse_pdf(
+    path,
+    confidence_threshold=0.5,
+    debug=False,
+    dpi=PDF_RENDER_DPI,
+    window=PDF_PAGE_WINDOW,
+    batch_size=YOLO_BATCH_SIZE,
+    imgsz=YOLO_IMGSZ,
+    executor=None,
+    text_layer_mode=TEXT_LAYER_MODE,
+    report=None,
+    cache=None,
+):
+    executor = executor or get_ocr_executor()
+
+    if cache is not None:
+        pdf_hash = sha256_file(path)
+        config_key = cache.config_key(
+            confidence_threshold=confidence_threshold,
+            dpi=dpi,
+            imgsz=imgsz,
+            text_layer_mode=text_layer_mode,
+            text_layer_min_chars=TEXT_LAYER_MIN_CHARS,
+            ocr_backend=OCR_BACKEND,
+        )
+
+    with pdfplumber.open(path) as pdf:
+        page_count = len(pdf.pages)
+
+        for first_page_num in range(0, page_count, window):
+            page_nums = range(first_page_num, min(first_page_num + window, page_count))
+
+            decisions = {}
+            for page_num in page_nums:
+                cached_text = cache.get_page(pdf_hash, config_key, page_num) if cache is not None else None
+                if cached_text is not None:
+                    decisions[page_num] = ("cached", cached_text)
                 else:
-                    fallback = pytesseract.image_to_string(crop, lang="eng")
-                    page_text.append(f"UNKNOWN BLOCK: {fallback}")
+                    decisions[page_num] = triage_page(pdf.pages[page_num], text_layer_mode)
+                print(f"Page {page_num + 1}: {decisions[page_num][0]}")
+                if report is not None:
+                    report.append({"page": page_num + 1, "mode": decisions[page_num][0]})
+
+            to_render = [
+                page_num for page_num in page_nums
+                if decisions[page_num][0] not in ("native", "cached")
+            ]
+            cv_images = render_pages(path, to_render, dpi) if to_render else {}
+            pages_blocks = dict(zip(
+                to_render,
+                detect_layout_batch([cv_images[page_num] for page_num in to_render], confidence_threshold, batch_size, imgsz)
+            ))
+
+            # Fan out every block of the window before collecting, so the pool
+            # works on several pages at once while results stay in reading order
+            pending_pages = []
+            for page_num in page_nums:
+                mode, known_text = decisions[page_num]
+                if mode in ("native", "cached"):
+                    pending_pages.append((page_num, known_text))
+                    continue
+
+                print(f"Processing page {page_num + 1}")
+                plumber_page = pdf.pages[page_num] if mode == "hybrid" else None
+                pending_pages.append((page_num, submit_page(
+                    executor, cv_images[page_num], page_num, pages_blocks[page_num], debug, plumber_page, dpi
+                )))
+
+            for page_num, pending in pending_pages:
+                fallbacks = []
+                page_text = pending if isinstance(pending, str) else collect_page(executor, pending, fallbacks)
+                # A page rescued by a fallback is worse than what a retry would
+                # give once the failing service is back, so never cache it
+                if fallbacks:
+                    print(f"Page {page_num + 1}: not cached, {len(fallbacks)} fallback block(s)")
+                elif cache is not None and decisions[page_num][0] != "cached":
+                    cache.set_page(pdf_hash, config_key, page_num, page_text)
+                yield page_num, page_text
+
+            # pdfplumber keeps every parsed Page (chars, layout) cached on the
+            # document; drop them once the window is done so memory stays flat
+            for page_num in page_nums:
+                if decisions[page_num][0] != "cached":
+                    pdf.pages[page_num].close()
+
+            del pending_pages, cv_images
 
-            results.append("\n".join(page_text))
+def summarize_triage(report):
+    counts = {"cached": 0, "native": 0, "hybrid": 0, "ocr": 0}
+    for entry in report:
+        counts[entry["mode"]] += 1
+    counts["total"] = len(report)
+    # Hybrid pages still go through rendering, YOLO and OCR for non-text
+    # blocks, so they are reported on their own rather than as avoided
+    counts["ocr_avoided"] = counts["cached"] + counts["native"]
+    counts["ocr_reduced"] = counts["hybrid"]
+    return counts
 
+def parse_pdf(
+    path,
+    confidence_threshold=0.5,
+    debug=False,
+    dpi=PDF_RENDER_DPI,
+    window=PDF_PAGE_WINDOW,
+    report=None,
+    use_cache=PARSE_CACHE_ENABLED,
+):
+    report = [] if report is None else report
+    cache = get_parse_cache() if use_cache else None
+    results = [
+        page_text
+        for _, page_text in iter_parse_pdf(
+            path, confidence_threshold, debug, dpi, window, report=report, cache=cache
+        )
+    ]
+    print(f"Text layer triage: {summarize_triage(report)}")
     return "\n\n".join(results)
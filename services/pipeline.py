@@ -0,0 +1,182 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from llama_index.core.schema import TextNode
+
+from config import PIPELINE_QUEUE_SIZE, INSERT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+# Streams pages through chunking, summaries, embeddings and index inserts.
+# Every stage runs concurrently and talks to the next through a bounded queue,
+# so a slow stage applies backpressure instead of buffering the whole document.
+class IngestionPipeline:
+    def __init__(
+        self,
+        client,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        insert_batch_size: int = INSERT_BATCH_SIZE,
+        summary_workers: Optional[int] = None,
+    ):
+        self.client = client
+        self.queue_size = queue_size
+        self.insert_batch_size = insert_batch_size
+        self.summary_workers = summary_workers or client.max_concurrent_requests
+
+    async def _chunk_stage(self, pages: AsyncIterator[str], chunk_queue: asyncio.Queue, state: Dict) -> None:
+        # The last chunk may continue on the next page, the chunker carries it over
+        chunker = self.client.chunker.stream()
+        async for page_text in pages:
+            for chunk in chunker.feed(page_text):
+                state["chunks"] += 1
+                await chunk_queue.put((state["chunks"], chunk))
+
+        for chunk in chunker.finish():
+            state["chunks"] += 1
+            await chunk_queue.put((state["chunks"], chunk))
+
+        for _ in range(self.summary_workers):
+            await chunk_queue.put(_DONE)
+
+    async def _summary_stage(
+        self,
+        chunk_queue: asyncio.Queue,
+        node_queue: asyncio.Queue,
+        doc_id_prefix: str,
+        metadata: Optional[Dict],
+        generate_summaries: bool,
+        state: Dict,
+    ) -> None:
+        while True:
+            # Take whatever is already queued, up to one summary batch
+            items = [await chunk_queue.get()]
+            while items[-1] is not _DONE and len(items) < self.client.summary_batch_size:
+                try:
+                    items.append(chunk_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            done = items[-1] is _DONE
+            if done:
+                items.pop()
+
+            changed = []
+            for chunk_index, chunk in items:
+                chunk_id = f"{doc_id_prefix}_chunk_{chunk_index}"
+                content_hash = self.client._content_hash(chunk)
+                if state["existing"].get(chunk_id, {}).get("content_hash") == content_hash:
+                    state["unchanged_ids"].append(chunk_id)
+                else:
+                    changed.append((chunk_index, chunk, content_hash))
+
+            summaries = [None] * len(changed)
+            if generate_summaries:
+                summaries = [state["known_summaries"].get(content_hash) for _, _, content_hash in changed]
+                missing = [i for i, summary in enumerate(summaries) if summary is None]
+                if missing:
+                    generated = await self.client._generate_summaries_async([changed[i][1] for i in missing])
+                    for i, summary in zip(missing, generated):
+                        summaries[i] = summary
+
+            for (chunk_index, chunk, _), summary in zip(changed, summaries):
+                await node_queue.put(self.client._build_chunk_node(doc_id_prefix, chunk_index, chunk, summary, metadata))
+
+            if done:
+                await node_queue.put(_DONE)
+                return
+
+    async def _insert_stage(self, node_queue: asyncio.Queue, state: Dict, on_inserted: Optional[Callable[[int], None]]) -> None:
+        batch: List[TextNode] = []
+        finished_workers = 0
+
+        while finished_workers < self.summary_workers:
+            item = await node_queue.get()
+            if item is _DONE:
+                finished_workers += 1
+                continue
+
+            batch.append(item)
+            if len(batch) >= self.insert_batch_size:
+                await self._flush(batch, state, on_inserted)
+                batch = []
+
+        if batch:
+            await self._flush(batch, state, on_inserted)
+
+    async def _flush(self, batch: List[TextNode], state: Dict, on_inserted: Optional[Callable[[int], None]]) -> None:
+        # Chunks that only shifted position keep their stored vectors
+        await asyncio.to_thread(self.client._reuse_stored_embeddings, batch, state["existing"])
+        await self.client._embed_nodes_async(batch)
+
+        # Records what it replaces and inserts in state, for the rollback in run()
+        await asyncio.to_thread(self.client._write_chunk_nodes, batch, state["existing"], state)
+        logger.info(f"Inserted micro-batch of {len(batch)} nodes ({len(state['inserted_ids'])} total)")
+
+        if on_inserted:
+            on_inserted(len(batch))
+
+    async def run(
+        self,
+        doc_id_prefix: str,
+        pages: AsyncIterator[str],
+        metadata: Optional[Dict] = None,
+        generate_summaries: bool = True,
+        on_inserted: Optional[Callable[[int], None]] = None,
+    ) -> int:
+        logger.info(f"Streaming document with prefix: {doc_id_prefix}")
+
+        chunk_queue = asyncio.Queue(maxsize=self.queue_size)
+        node_queue = asyncio.Queue(maxsize=self.queue_size)
+        existing = await asyncio.to_thread(self.client._load_chunk_versions, doc_id_prefix)
+        state = {
+            "chunks": 0,
+            "inserted_ids": [],
+            "replaced_rows": [],
+            "unchanged_ids": [],
+            "existing": existing,
+            "known_summaries": {
+                version["content_hash"]: version["summary"]
+                for version in existing.values()
+                if version["content_hash"] and version["summary"]
+            },
+        }
+
+        tasks = [
+            asyncio.create_task(self._chunk_stage(pages, chunk_queue, state)),
+            *[
+                asyncio.create_task(self._summary_stage(
+                    chunk_queue, node_queue, doc_id_prefix, metadata, generate_summaries, state
+                ))
+                for _ in range(self.summary_workers)
+            ],
+            asyncio.create_task(self._insert_stage(node_queue, state, on_inserted)),
+        ]
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            # Do not leave a half-ingested document behind
+            if state["inserted_ids"]:
+                logger.warning(f"Removing {len(state['inserted_ids'])} partially inserted nodes for {doc_id_prefix}")
+            await asyncio.to_thread(self.client._rollback_chunk_writes, state)
+            raise
+
+        # total_chunks is only known once the last page is chunked
+        stale_ids = await asyncio.to_thread(
+            self.client._finish_chunk_writes,
+            doc_id_prefix, existing, state["chunks"], state["inserted_ids"] + state["unchanged_ids"]
+        )
+
+        logger.info(
+            f"Streamed {doc_id_prefix}: {len(state['inserted_ids'])} inserted, "
+            f"{len(state['unchanged_ids'])} unchanged, {len(stale_ids)} removed"
+        )
+        return state["chunks"]
@@ -0,0 +1,105 @@
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    PIX2TEX_URL, PIX2TEX_MAX_IN_FLIGHT, PIX2TEX_TIMEOUT, PIX2TEX_RETRIES,
+    PIX2TEX_CACHE_PATH, PIX2TEX_CACHE_MAX_BYTES
+)
+from services.cache import DiskCache
+
+
+class FormulaOcrClient:
+    def __init__(
+        self,
+        url=PIX2TEX_URL,
+        max_in_flight=PIX2TEX_MAX_IN_FLIGHT,
+        timeout=PIX2TEX_TIMEOUT,
+        retries=PIX2TEX_RETRIES,
+        cache=None,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.cache = cache
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # The pool size caps in-flight requests to the pix2tex container
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="pix2tex")
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _post(self, png_bytes):
+        resp = self.session.post(
+            self.url,
+            files={"file": ("image.png", png_bytes, "image/png")},
+            timeout=self.timeout
+        )
+        resp.raise_for_status()
+        return resp.text.strip()
+
+    def _recognize_png(self, key, png_bytes):
+        try:
+            latex = self._post(png_bytes)
+            if self.cache is not None:
+                self.cache.set(key, latex.encode("utf-8"))
+            return latex
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def submit(self, image):
+        ok, png = cv2.imencode(".png", image) if image.size else (False, None)
+        if not ok:
+            future = Future()
+            future.set_exception(ValueError("Failed to encode formula crop as PNG"))
+            return future
+        png_bytes = png.tobytes()
+        key = hashlib.sha256(png_bytes).hexdigest()
+
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached.decode("utf-8"))
+                return future
+
+        # Identical crops submitted while the first one is still running share its request
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._recognize_png, key, png_bytes)
+                self._inflight[key] = future
+        return future
+
+    def recognize(self, image):
+        return self.submit(image).result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_formula_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FormulaOcrClient(cache=DiskCache(PIX2TEX_CACHE_PATH, PIX2TEX_CACHE_MAX_BYTES))
+    return _client
@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+# (chunk id, doc_id_prefix, has_math, text size in bytes)
+ChunkRow = Tuple[str, str, bool, int]
+
+
+# Collection statistics kept up to date by the client on every write, so
+# reading them never scans Chroma. Per-chunk rows make deletes and
+# re-inserts exact; per-document and total aggregates make reads cheap.
+# Every row is scoped to one collection, so clients of different
+# collections (or Chroma directories) can share the file.
+class StatsStore:
+    def __init__(self, path: str, collection: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.collection = collection
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS chunk_stats (
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                doc_id_prefix TEXT NOT NULL,
+                has_math INTEGER NOT NULL,
+                text_bytes INTEGER NOT NULL,
+                PRIMARY KEY (collection, id)
+            );
+            CREATE TABLE IF NOT EXISTS document_stats (
+                collection TEXT NOT NULL,
+                doc_id_prefix TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                math_chunks INTEGER NOT NULL,
+                text_bytes INTEGER NOT NULL,
+                PRIMARY KEY (collection, doc_id_prefix)
+            );
+            CREATE TABLE IF NOT EXISTS totals (
+                collection TEXT PRIMARY KEY,
+                chunks INTEGER NOT NULL,
+                math_chunks INTEGER NOT NULL,
+                text_bytes INTEGER NOT NULL,
+                initialized INTEGER NOT NULL
+            );"""
+        )
+        self._conn.execute("INSERT OR IGNORE INTO totals VALUES (?, 0, 0, 0, 0)", (collection,))
+        self._conn.commit()
+
+    def _apply(self, doc_id_prefix: str, sign: int, has_math: bool, text_bytes: int) -> None:
+        math_delta = sign * int(bool(has_math))
+        self._conn.execute(
+            "INSERT INTO document_stats VALUES (?, ?, ?, ?, ?) ON CONFLICT(collection, doc_id_prefix) DO UPDATE SET "
+            "chunks = chunks + excluded.chunks, math_chunks = math_chunks + excluded.math_chunks, "
+            "text_bytes = text_bytes + excluded.text_bytes",
+            (self.collection, doc_id_prefix, sign, math_delta, sign * text_bytes)
+        )
+        self._conn.execute(
+            "UPDATE totals SET chunks = chunks + ?, math_chunks = math_chunks + ?, text_bytes = text_bytes + ? "
+            "WHERE collection = ?",
+            (sign, math_delta, sign * text_bytes, self.collection)
+        )
+
+    def _remove_locked(self, ids: Iterable[str]) -> None:
+        for chunk_id in ids:
+            row = self._conn.execute(
+                "SELECT doc_id_prefix, has_math, text_bytes FROM chunk_stats WHERE collection = ? AND id = ?",
+                (self.collection, chunk_id)
+            ).fetchone()
+            if row is None:
+                continue
+            self._conn.execute("DELETE FROM chunk_stats WHERE collection = ? AND id = ?", (self.collection, chunk_id))
+            self._apply(row[0], -1, row[1], row[2])
+        self._conn.execute("DELETE FROM document_stats WHERE collection = ? AND chunks <= 0", (self.collection,))
+
+    def upsert(self, rows: List[ChunkRow]) -> None:
+        with self._lock:
+            self._remove_locked(row[0] for row in rows)
+            for chunk_id, doc_id_prefix, has_math, text_bytes in rows:
+                self._conn.execute(
+                    "INSERT INTO chunk_stats VALUES (?, ?, ?, ?, ?)",
+                    (self.collection, chunk_id, doc_id_prefix, int(bool(has_math)), text_bytes)
+                )
+                self._apply(doc_id_prefix, 1, has_math, text_bytes)
+            self._conn.commit()
+
+    def remove(self, ids: List[str]) -> None:
+        with self._lock:
+            self._remove_locked(ids)
+            self._conn.commit()
+
+    def clear(self, initialized: bool = True) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunk_stats WHERE collection = ?", (self.collection,))
+            self._conn.execute("DELETE FROM document_stats WHERE collection = ?", (self.collection,))
+            self._conn.execute(
+                "UPDATE totals SET chunks = 0, math_chunks = 0, text_bytes = 0, initialized = ? WHERE collection = ?",
+                (int(initialized), self.collection)
+            )
+            self._conn.commit()
+
+    def mark_initialized(self) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE totals SET initialized = 1 WHERE collection = ?", (self.collection,))
+            self._conn.commit()
+
+    def is_initialized(self) -> bool:
+        with self._lock:
+            return bool(self._conn.execute(
+                "SELECT initialized FROM totals WHERE collection = ?", (self.collection,)
+            ).fetchone()[0])
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            chunks, math_chunks, text_bytes = self._conn.execute(
+                "SELECT chunks, math_chunks, text_bytes FROM totals WHERE collection = ?", (self.collection,)
+            ).fetchone()
+            documents = {
+                row[0]: {"chunks": row[1], "math_chunks": row[2], "text_bytes": row[3]}
+                for row in self._conn.execute(
+                    "SELECT doc_id_prefix, chunks, math_chunks, text_bytes FROM document_stats "
+                    "WHERE collection = ? ORDER BY doc_id_prefix",
+                    (self.collection,)
+                )
+            }
+        return {
+            "total_chunks": chunks,
+            "math_chunks": math_chunks,
+            "total_text_bytes": text_bytes,
+            "documents": documents,
+        }